@@ -31,7 +31,9 @@ print()
 print("▶ 1. MODULE IMPORTS")
 try:
     from shared_data import (
-        DATA_DIR, get_queue, save_queue, get_branch, save_branch,
+        DATA_DIR, get_queue, save_queue, update_queue, VersionConflict,
+        assign_bqms, verify_counts, allocate,
+        get_branch, save_branch,
         get_categories, get_users, VER, today_iso, today_mmdd, gen_id
     )
     test("shared_data imports", True, f"Version {VER}")
@@ -48,7 +50,7 @@ test("DATA_DIR is absolute", DATA_DIR.is_absolute(), str(DATA_DIR))
 
 # ── TEST 3: File creation and reading ──
 print("\n▶ 3. FILE I/O")
-branch = get_branch()
+branch = get_branch(private=True)
 test("branch.json readable", isinstance(branch, dict), f"keys={list(branch.keys())[:5]}")
 test("branch has name", bool(branch.get("name")), branch.get("name","MISSING"))
 test("branch has announcement field", "announcement" in branch)
@@ -60,7 +62,7 @@ test("categories have services", all("services" in c for c in cats))
 users = get_users()
 test("users.json readable", isinstance(users, list), f"{len(users)} users")
 
-queue = get_queue()
+queue = get_queue(private=True)
 test("queue file readable", isinstance(queue, dict), f"keys={list(queue.keys())}")
 test("queue has 'res' array", isinstance(queue.get("res"), list))
 test("queue has 'oStat'", "oStat" in queue, f"value={queue.get('oStat')}")
@@ -84,7 +86,7 @@ queue["res"].append(test_entry)
 save_queue(queue)
 
 # Read back
-queue2 = get_queue()
+queue2 = get_queue(private=True)
 found = any(r.get("id") == "DIAG_TEST_001" for r in queue2.get("res", []))
 test("Write → Read reservation", found,
      f"wrote 1 entry, read back {len(queue2.get('res',[]))} entries")
@@ -92,7 +94,7 @@ test("Write → Read reservation", found,
 # Test oStat write
 queue2["oStat"] = "intermittent"
 save_queue(queue2)
-queue3 = get_queue()
+queue3 = get_queue(private=True)
 test("Write → Read oStat", queue3.get("oStat") == "intermittent",
      f"wrote 'intermittent', read back '{queue3.get('oStat')}'")
 
@@ -139,12 +141,7 @@ test("Search by Res#", found_rn is not None,
 
 # ── TEST 6: Assign BQMS and verify ──
 print("\n▶ 6. BQMS ASSIGNMENT SIMULATION")
-fresh = get_queue()
-for r in fresh["res"]:
-    if r["id"] == "DIAG_TEST_001":
-        r["bqmsNumber"] = "L-DIAG"
-        r["status"] = "ARRIVED"
-save_queue(fresh)
+assign_bqms("DIAG_TEST_001", "l-diag")
 
 q2 = get_queue()
 diag_entry = next((r for r in q2["res"] if r["id"] == "DIAG_TEST_001"), None)
@@ -153,6 +150,45 @@ test("BQMS assigned", diag_entry and diag_entry.get("bqmsNumber") == "L-DIAG",
 test("Status updated to ARRIVED", diag_entry and diag_entry.get("status") == "ARRIVED",
      f"status={diag_entry.get('status') if diag_entry else 'ENTRY GONE!'}")
 
+# ── TEST 6b: Concurrent writers (update_queue holds the lock) ──
+print("\n▶ 6b. ATOMIC UPDATE — CONCURRENT WRITERS")
+import threading
+def _bump(q):
+    for r in q["res"]:
+        if r["id"] == "DIAG_TEST_001":
+            r["slot"] = r.get("slot", 0) + 1
+workers = [threading.Thread(target=update_queue, args=(_bump,)) for _ in range(10)]
+for t in workers: t.start()
+for t in workers: t.join()
+diag_entry = next((r for r in get_queue()["res"] if r["id"] == "DIAG_TEST_001"), None)
+test("10 simultaneous updates, none lost",
+     diag_entry and diag_entry.get("slot") == 1009,
+     f"slot={diag_entry.get('slot') if diag_entry else 'ENTRY GONE!'} (expected 1009)")
+
+stale = get_queue()
+save_queue(get_queue())                       # someone else saves first
+try:
+    save_queue(stale, expected_version=stale.get("version", 0))
+    conflict = False
+except VersionConflict:
+    conflict = True
+test("Stale save rejected (version check)", conflict,
+     f"version now {get_queue().get('version')}")
+
+a, b = allocate(1), allocate(2)
+test("Slot allocator hands out fresh numbers", len(a) == 1 and b == [a[0] + 1, a[0] + 2],
+     f"allocate(1)={a}, allocate(2)={b}")
+
+bad = verify_counts(get_queue())
+test("Slot counters match entries", not bad,
+     "consistent" if not bad else f"mismatch: {bad}")
+
+hot = get_queue(active_only=True)
+test("Active segment holds only open entries",
+     all(r.get("status") not in ("COMPLETED", "NO_SHOW") for r in hot["res"])
+     and any(r["id"] == "DIAG_TEST_001" for r in hot["res"]),
+     f"{len(hot['res'])} active of {len(get_queue()['res'])}")
+
 # ── TEST 7: streamlit-autorefresh ──
 print("\n▶ 7. DEPENDENCIES")
 try:
@@ -178,22 +214,25 @@ else:
     test("shared_data location", False, "NOT FOUND on sys.path!")
 
 # Verify actual file paths
-from shared_data import BRANCH_FILE, CATS_FILE, USERS_FILE, _queue_file
-qf = _queue_file()
-test("Queue file path", True, str(qf))
-test("Queue file exists", qf.exists(), str(qf))
-test("Branch file exists", BRANCH_FILE.exists(), str(BRANCH_FILE))
+from shared_data import BRANCH_FILE, CATS_FILE, USERS_FILE, STORAGE, storage_info
+info = storage_info()
+qf = info["label"]
+test("Storage mode", True, STORAGE)
+test("Queue storage exists", bool(info["paths"]) and all(p.exists() for p in info["paths"]),
+     f"{qf} ({info['bytes']} bytes)")
+if STORAGE != "sqlite":
+    test("Branch file exists", BRANCH_FILE.exists(), str(BRANCH_FILE))
 
 # ── CLEANUP ──
 print("\n▶ CLEANUP")
 # Remove diagnostic entry
-final_q = get_queue()
+final_q = get_queue(private=True)
 final_q["res"] = [r for r in final_q["res"] if r.get("id") != "DIAG_TEST_001"]
 final_q["oStat"] = "online"
 final_q["bqmsState"] = {}
 save_queue(final_q)
 
-branch_clean = get_branch()
+branch_clean = get_branch(private=True)
 branch_clean["announcement"] = ""
 save_branch(branch_clean)
 test("Diagnostic data cleaned up", True)
@@ -214,7 +253,7 @@ else:
 print("═══════════════════════════════════════════════════")
 print()
 print("📂 Data directory:", str(DATA_DIR))
-print("📄 Queue file:   ", str(qf))
+print("📄 Queue storage:", qf)
 print("📄 Branch file:  ", str(BRANCH_FILE))
 print()
 print("If all tests pass but portals still seem disconnected:")
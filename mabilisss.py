@@ -8,109 +8,25 @@
 """
 
 import streamlit as st
-import json, os, time, uuid, csv, io
+import time, csv, io
 from datetime import datetime, date
-from pathlib import Path
 
 # ═══════════════════════════════════════════════════
-#  DATA LAYER (embedded — no external imports)
+#  DATA LAYER (shared_data — same storage backend as the split portals)
 # ═══════════════════════════════════════════════════
-VER = "V1.1.0"
-_DIR = Path(__file__).resolve().parent / "data"
-_DIR.mkdir(exist_ok=True)
-
-def _qf(d=None):
-    return _DIR / f"queue_{d or date.today().isoformat()}.json"
-
-def _r(path, default):
-    if not path.exists():
-        _w(path, default)
-        return default
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except:
-        return default
-
-def _w(path, data):
-    tmp = str(path) + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=2, default=str, ensure_ascii=False)
-    os.replace(tmp, str(path))
-
-BRANCH_F = _DIR / "branch.json"
-CATS_F   = _DIR / "categories.json"
-USERS_F  = _DIR / "users.json"
-
-DEF_BRANCH = {
-    "name": "SSS Gingoog Branch",
-    "address": "National Highway, Gingoog City",
-    "hours": "Mon-Fri, 8:00 AM - 5:00 PM",
-    "phone": "", "openTime": "06:00", "closeTime": "16:00",
-    "bqmsStartTime": "08:00", "announcement": "",
-}
+from shared_data import (
+    DATA_DIR as _DIR, storage_info,
+    get_branch, save_branch, get_users, save_users, get_queue, update_queue,
+    assign_bqms, set_status, mark_no_show, apply_edits, STATUSES,
+    get_categories as get_cats, save_categories as save_cats,
+    slot_counts, next_slot_num as next_slot, is_duplicate as is_dup,
+    get_entry, gen_id, today_mmdd as mmdd, data_context, watch_session,
+    live_fragment, tracker_refresh, wait_estimate,
+    render_start, render_end, pressure_level, pressure_interval, load_stats,
+    PRESSURE_LABELS, page_slice, search_queue, queue_view, read_stats, LIVE_VIEWS,
+)
 
-DEF_CATS = [
-    {"id":"ret_death","label":"Retirement / Death / Funeral","icon":"🏖️","short":"Ret/Death","avgTime":16,"cap":50,
-     "services":[{"id":"retirement","label":"Retirement Claim"},{"id":"death_claim","label":"Death Claim"},{"id":"funeral","label":"Funeral Benefit"}]},
-    {"id":"smd","label":"Sickness / Maternity / Disability","icon":"🏥","short":"Sick/Mat","avgTime":14,"cap":50,
-     "services":[{"id":"sickness","label":"Sickness Benefit"},{"id":"maternity","label":"Maternity / Paternity"},{"id":"disability","label":"Disability Benefit"}]},
-    {"id":"loans","label":"Loans","icon":"💰","short":"Loans","avgTime":10,"cap":60,
-     "services":[{"id":"salary_loan","label":"Salary Loan"},{"id":"calamity_loan","label":"Calamity Loan"},{"id":"emergency_loan","label":"Emergency Loan"},{"id":"consoloan","label":"Consoloan"}]},
-    {"id":"membership","label":"Membership / ID / Inquiries","icon":"🪪","short":"Members","avgTime":8,"cap":60,
-     "services":[{"id":"new_member","label":"New Registration"},{"id":"umid","label":"UMID Enrollment / Release"},{"id":"e1_update","label":"E-1 / E-4 Update"},{"id":"inquiry","label":"General Inquiry"},{"id":"member_record","label":"Member Records"}]},
-    {"id":"acop","label":"ACOP","icon":"📋","short":"ACOP","avgTime":10,"cap":30,
-     "services":[{"id":"acop_filing","label":"ACOP Filing"},{"id":"acop_followup","label":"ACOP Follow-up"}]},
-    {"id":"payments","label":"Payments","icon":"💳","short":"Payments","avgTime":7,"cap":70,
-     "services":[{"id":"pay_contribution","label":"Contribution Payment"},{"id":"pay_loan","label":"Loan Amortization"},{"id":"pay_others","label":"Other Payments / PRN"}]},
-    {"id":"employers","label":"Employers","icon":"🏢","short":"Employers","avgTime":12,"cap":30,
-     "services":[{"id":"er_registration","label":"Employer Registration"},{"id":"er_reporting","label":"Collection / Reporting"},{"id":"er_inquiry","label":"Employer Inquiry"},{"id":"er_certificate","label":"Employer Certification"}]},
-]
-
-DEF_USERS = [
-    {"id":"kiosk","username":"kiosk","displayName":"Guard / Kiosk","role":"kiosk","password":"mnd2026","active":True},
-    {"id":"staff1","username":"staff1","displayName":"Staff 1","role":"staff","password":"mnd2026","active":True},
-    {"id":"staff2","username":"staff2","displayName":"Staff 2","role":"staff","password":"mnd2026","active":True},
-    {"id":"th","username":"th","displayName":"Team Head","role":"th","password":"mnd2026","active":True},
-    {"id":"bh","username":"bh","displayName":"Branch Head","role":"bh","password":"mnd2026","active":True},
-    {"id":"dh","username":"dh","displayName":"Division Head","role":"dh","password":"mnd2026","active":True},
-]
-
-def get_branch():     return _r(BRANCH_F, DEF_BRANCH)
-def save_branch(d):   _w(BRANCH_F, d)
-def get_cats():       return _r(CATS_F, DEF_CATS)
-def save_cats(d):     _w(CATS_F, d)
-def get_users():      return _r(USERS_F, DEF_USERS)
-def save_users(d):    _w(USERS_F, d)
-def get_queue(d=None):
-    return _r(_qf(d), {"res":[], "bqmsState":{}, "oStat":"online", "date": d or date.today().isoformat()})
-def save_queue(data, d=None):
-    data["date"] = d or date.today().isoformat()
-    _w(_qf(d), data)
-
-def slot_counts(cats, res_list):
-    m = {}
-    for c in cats:
-        active = [r for r in res_list if r.get("categoryId") == c["id"] and r.get("status") != "NO_SHOW"]
-        m[c["id"]] = {"used": len(active), "cap": c.get("cap",50), "remaining": max(0, c.get("cap",50) - len(active))}
-    return m
-
-def next_slot(res_list):
-    return len(res_list) + 1
-
-def is_dup(res_list, last, first, mob):
-    nk = f"{last}|{first}"
-    for r in res_list:
-        if r.get("status") in ("NO_SHOW","COMPLETED"): continue
-        if f"{r.get('lastName','')}|{r.get('firstName','')}" == nk: return True
-        if mob and r.get("mobile") and r["mobile"] == mob: return True
-    return False
-
-def gen_id():
-    return f"{int(time.time()*1000)}-{uuid.uuid4().hex[:6]}"
-
-def mmdd():
-    return date.today().strftime("%m%d")
+VER = "V1.1.0"
 
 OSTATUS = {
     "online":       {"label":"Reservation Open",             "emoji":"🟢","color":"green"},
@@ -147,14 +63,23 @@ st.markdown("""<style>
 .stButton>button{border-radius:8px;font-weight:700}
 </style>""", unsafe_allow_html=True)
 
-# ── Auto-refresh ──
-_ar_ok = False
-try:
-    from streamlit_autorefresh import st_autorefresh
-    st_autorefresh(interval=15_000, limit=None, key="global_ar")
-    _ar_ok = True
-except ImportError:
-    pass
+# ── Auto-refresh (pushed by the shared_data watcher; without push the
+#    tracker card and staff queue refresh as fragments; timed fallback).
+#    Under load, member sessions give up push and refresh less often. ──
+_pressure = pressure_level()
+_member = st.session_state.get("portal", "member") != "staff"
+_live = watch_session(enabled=_pressure == 0 or not _member)
+_tick = None if _live else pressure_interval(15, _pressure) if _member else 15
+_frag_page = (st.session_state.get("portal") == "staff"
+              or st.session_state.get("screen") == "tracker")
+_ar_ok = _live or _frag_page
+if not _ar_ok:
+    try:
+        from streamlit_autorefresh import st_autorefresh
+        st_autorefresh(interval=_tick * 1000, limit=None, key="global_ar")
+        _ar_ok = True
+    except ImportError:
+        pass
 
 # ── Session defaults ──
 for k, v in {"portal":"member","screen":"home","sel_cat":None,"sel_svc":None,
@@ -162,9 +87,14 @@ for k, v in {"portal":"member","screen":"home","sel_cat":None,"sel_svc":None,
              "lock_until":0,"staff_tab":"queue","last_activity":time.time()}.items():
     if k not in st.session_state:
         st.session_state[k] = v
+_t0 = render_start(st.session_state.setdefault("_load_key", gen_id()))
 
 now = datetime.now()
 
+# ── DATA CONTEXT — each document loaded / derived value built at most once
+#    per data version, shared by the sidebar, both portals and fragments ──
+ctx = data_context(st.session_state)
+
 # ── PORTAL SWITCHER (sidebar) ──
 with st.sidebar:
     st.markdown("### 🏛️ MabiliSSS Queue")
@@ -172,16 +102,20 @@ with st.sidebar:
                        index=0 if st.session_state.portal == "member" else 1)
     st.session_state.portal = "member" if "Member" in portal else "staff"
     st.markdown("---")
-    # DIAGNOSTIC — ALWAYS VISIBLE
-    q_diag = get_queue()
-    b_diag = get_branch()
+    # DIAGNOSTIC — ALWAYS VISIBLE (from the render's DataContext)
+    q_diag = ctx["summary"]
+    b_diag = ctx["branch"]
+    _rs    = read_stats()
+    _qs    = storage_info()
     st.markdown(f"""**🔗 Live Data Status**
 - 📂 `{_DIR}`
-- 📄 `{_qf().name}`
-- 📊 **{len(q_diag.get('res',[]))} entries**
-- 🚦 oStat: **{q_diag.get('oStat','?')}**
+- 📄 `{_qs['label']}` · {_qs['bytes'] // 1024} KB
+- 📊 **{q_diag['total']} entries**
+- 🚦 oStat: **{q_diag['oStat']}**
 - 📢 Ann: {'✅' if b_diag.get('announcement','').strip() else '—'}
-- 🔄 Auto-refresh: {'✅ 15s' if _ar_ok else '❌'}""")
+- 🔄 Auto-refresh: {'✅ push' if _live else f'✅ {_tick}s' if _ar_ok else '❌'}
+- 🌡️ Load: {PRESSURE_LABELS[_pressure]}
+- 📥 Reads: {_rs['loads']} loaded · {_rs['coalesced']} coalesced""")
     if not _ar_ok:
         st.warning("Install: `pip install streamlit-autorefresh`")
     if st.button("🔄 Manual Refresh", use_container_width=True):
@@ -192,20 +126,24 @@ def go(scr):
     st.session_state.screen = scr
     st.rerun()
 
+def after_action(result):
+    """Rerun to show a queue action, or report that the queue was busy."""
+    if result is None: st.error("⚠️ Queue busy — try again.")
+    else: st.rerun()
+
 # ════════════════════════════════════════════════════════
 # ════════════════════════════════════════════════════════
 #  MEMBER PORTAL
 # ════════════════════════════════════════════════════════
 # ════════════════════════════════════════════════════════
 if st.session_state.portal == "member":
-    branch = get_branch()
-    cats   = get_cats()
-    qdata  = get_queue()
-    res    = qdata.get("res", [])
+    branch = ctx["branch"]
+    cats   = ctx["cats"]
+    qdata  = ctx["live"]            # active entries — closed ones only via get_entry()
     bqms_st= qdata.get("bqmsState", {})
     o_stat = qdata.get("oStat", "online")
     is_open= o_stat != "offline"
-    sc     = slot_counts(cats, res)
+    sc     = ctx["sc"]
 
     # Header
     st.markdown(f"""<div class="sss-header">
@@ -240,8 +178,8 @@ if st.session_state.portal == "member":
 
     # ── HOME ──
     if screen == "home":
-        active_q = len([r for r in res if r.get("status") not in ("COMPLETED","NO_SHOW")])
-        done_q   = len([r for r in res if r.get("status") == "COMPLETED"])
+        active_q = ctx["summary"]["active"]
+        done_q   = ctx["summary"]["done"]
         c1, c2 = st.columns(2)
         with c1:
             st.markdown(f'<div class="sss-metric"><div class="val" style="color:#3399CC;">{active_q}</div><div class="lbl">Active Queue</div></div>', unsafe_allow_html=True)
@@ -324,22 +262,23 @@ if st.session_state.portal == "member":
 
                 if st.form_submit_button("📋 Reserve My Slot", type="primary", use_container_width=True):
                     lu = last_name.strip().upper(); fu = first_name.strip().upper(); mob = mobile.strip()
-                    fresh = get_queue(); fr = fresh.get("res",[])
                     errors = []
                     if not lu: errors.append("Last Name required.")
                     if not fu: errors.append("First Name required.")
                     if not mob or len(mob) < 10: errors.append("Valid mobile required.")
                     if not consent: errors.append("Check privacy consent.")
-                    fsc = slot_counts(cats, fr)
-                    if fsc.get(cat["id"],{}).get("remaining",0) <= 0: errors.append("Slots full.")
-                    if is_dup(fr, lu, fu, mob): errors.append("Duplicate reservation.")
 
-                    if errors:
-                        for e in errors: st.error(f"❌ {e}")
-                    else:
-                        slot = next_slot(fr)
+                    entry = {}
+                    def _reserve(fresh):
+                        fr = fresh.setdefault("res",[])
+                        fsc = slot_counts(cats, fresh)
+                        if fsc.get(cat["id"],{}).get("remaining",0) <= 0: errors.append("Slots full.")
+                        if is_dup(fresh, lu, fu, mob): errors.append("Duplicate reservation.")
+                        if errors: return False
+                        slot = entry.get("slot") or next_slot()
+                        if slot is None: errors.append("System busy — try again."); return False
                         rn = f"R-{mmdd()}-{slot:03d}"
-                        entry = {
+                        entry.update({
                             "id": gen_id(), "slot": slot, "resNum": rn,
                             "lastName": lu, "firstName": fu, "mi": mi.strip().upper(),
                             "mobile": mob, "service": svc["label"], "serviceId": svc["id"],
@@ -348,8 +287,14 @@ if st.session_state.portal == "member":
                             "status": "RESERVED", "bqmsNumber": None,
                             "source": "ONLINE", "issuedAt": now.isoformat(),
                             "arrivedAt": None, "completedAt": None,
-                        }
-                        fr.append(entry); fresh["res"] = fr; save_queue(fresh)
+                        })
+                        fr.append(entry)
+
+                    if not errors and update_queue(_reserve) is None:
+                        errors.append("System busy — tap Reserve again.")
+                    if errors:
+                        for e in errors: st.error(f"❌ {e}")
+                    else:
                         st.session_state.ticket = entry; go("ticket")
 
     # ── TICKET ──
@@ -398,32 +343,20 @@ if st.session_state.portal == "member":
                 track_val = st.text_input("Reservation #", placeholder="R-0214-005 or K-0214-001")
 
             if st.form_submit_button("🔍 Find My Queue", type="primary", use_container_width=True):
-                fresh = get_queue(); fr = fresh.get("res",[])
+                fr = get_queue(active_only=True).get("res",[])
                 v = track_val.strip()
                 if not v:
                     st.error("Enter a value.")
                 else:
-                    found = None
                     if "Mobile" in track_mode:
-                        for r in fr:
-                            if r.get("mobile") == v and r.get("status") not in ("COMPLETED","NO_SHOW"):
-                                found = r; break
-                        if not found:
-                            for r in fr:
-                                if r.get("mobile") == v: found = r; break
+                        found = get_entry(mobile=v)
                     else:
-                        vu = v.upper()
-                        for r in fr:
-                            if r.get("resNum") == vu and r.get("status") not in ("COMPLETED","NO_SHOW"):
-                                found = r; break
-                        if not found:
-                            for r in fr:
-                                if r.get("resNum") == vu: found = r; break
+                        found = get_entry(res_num=v.upper())
                     if not found:
                         st.error(f"❌ Not found for '{v}'. Check input.")
                         # Debug: show what's in queue
                         if fr:
-                            st.caption(f"Queue has {len(fr)} entries: {', '.join(r.get('resNum','?') for r in fr[:10])}")
+                            st.caption(f"Queue has {len(fr)} active entries: {', '.join(r.get('resNum','?') for r in fr[:10])}")
                         else:
                             st.caption("Queue is empty — no entries today.")
                     else:
@@ -431,63 +364,64 @@ if st.session_state.portal == "member":
 
     # ── TRACKER ──
     elif screen == "tracker":
-        tid = st.session_state.tracked_id
-        fresh = get_queue(); fr = fresh.get("res",[]); fbq = fresh.get("bqmsState",{})
-        t = next((r for r in fr if r.get("id") == tid), None)
-        if not t:
-            st.error("❌ Entry not found.")
-            if st.button("← Try Again"): go("track_input")
-        else:
-            has_bqms = bool(t.get("bqmsNumber"))
-            is_done  = t.get("status") == "COMPLETED"
-            is_ns    = t.get("status") == "NO_SHOW"
-            is_srv   = t.get("status") == "SERVING"
-
-            if is_srv:
-                st.markdown('<div class="sss-alert sss-alert-blue" style="font-size:18px;">🎉 <strong>YOU\'RE BEING SERVED!</strong></div>', unsafe_allow_html=True)
-            elif is_done:
-                st.markdown(f'<div class="sss-alert sss-alert-green">✅ <strong>Completed</strong> — Thank you!</div>', unsafe_allow_html=True)
-            elif is_ns:
-                st.markdown('<div class="sss-alert sss-alert-red">❌ <strong>No-Show</strong></div>', unsafe_allow_html=True)
-
-            _sl = {"RESERVED":"📋 RESERVED","ARRIVED":"✅ ARRIVED","SERVING":"🔵 SERVING","COMPLETED":"✅ DONE","NO_SHOW":"❌ NO-SHOW"}
-            st.markdown(f"""<div class="sss-card" style="border-top:4px solid {'#22B8CF' if has_bqms else '#3399CC'};text-align:center;">
-                <div style="font-size:11px;opacity:.5;">{branch['name'].upper()}</div>
-                <div style="font-weight:700;margin:4px 0;">{t['category']} — {t['service']}</div>
-                <span class="sss-badge" style="background:rgba(51,153,204,.15);color:#3399CC;">{_sl.get(t['status'],t['status'])}</span>
-            </div>""", unsafe_allow_html=True)
-
-            if has_bqms:
-                st.markdown(f'<div class="sss-card" style="text-align:center;"><div style="font-size:11px;opacity:.5;">YOUR BQMS NUMBER</div><div class="sss-bqms">{t["bqmsNumber"]}</div></div>', unsafe_allow_html=True)
-                if not is_done and not is_ns:
-                    cat_obj = next((c for c in cats if c["id"] == t.get("categoryId")), None)
-                    bq = fbq.get(t.get("categoryId",""),{})
-                    ns_val = bq.get("nowServing","—")
-                    avg = cat_obj["avgTime"] if cat_obj else 10
-                    ahead = 0
-                    try:
-                        ns_num = int("".join(filter(str.isdigit, str(ns_val))))
-                        my_num = int("".join(filter(str.isdigit, str(t["bqmsNumber"]))))
-                        ahead = max(0, my_num - ns_num)
-                    except: pass
-                    est = ahead * avg
-                    m1,m2,m3 = st.columns(3)
-                    with m1: st.markdown(f'<div class="sss-metric"><div class="val" style="color:#22B8CF;">{ns_val}</div><div class="lbl">Now Serving</div></div>', unsafe_allow_html=True)
-                    with m2: st.markdown(f'<div class="sss-metric"><div class="val">{t["bqmsNumber"]}</div><div class="lbl">Your #</div></div>', unsafe_allow_html=True)
-                    with m3:
-                        wt = "Next!" if est == 0 else f"~{est}m"
-                        st.markdown(f'<div class="sss-metric"><div class="val">{wt}</div><div class="lbl">Est. Wait</div></div>', unsafe_allow_html=True)
+        # Refresh cadence follows the member's place in line (tracker_refresh)
+        _t = get_entry(st.session_state.tracked_id)
+        _every = pressure_interval(tracker_refresh(_t, qdata, cats), _pressure) if _t else _tick
+
+        @live_fragment(run_every=None if _live else _every)
+        def _tracker_card():
+            view = data_context(st.session_state)
+            branch, cats = view["branch"], view["cats"]
+            tid = st.session_state.tracked_id
+            fresh = view["live"]
+            t = get_entry(tid)
+            if t and not _live and pressure_interval(tracker_refresh(t, fresh, cats), _pressure) != _every: st.rerun()
+            if not t:
+                st.error("❌ Entry not found.")
+                if st.button("← Try Again"): go("track_input")
             else:
-                if not is_done and not is_ns:
-                    st.markdown(f'<div class="sss-card" style="text-align:center;"><div style="font-size:11px;opacity:.5;">RESERVATION NUMBER</div><div class="sss-resnum">{t["resNum"]}</div></div>', unsafe_allow_html=True)
-                    st.markdown('<div class="sss-alert sss-alert-yellow">⏳ <strong>Waiting for BQMS Number</strong><br/>Staff will assign. Auto-refreshes.</div>', unsafe_allow_html=True)
+                has_bqms = bool(t.get("bqmsNumber"))
+                is_done  = t.get("status") == "COMPLETED"
+                is_ns    = t.get("status") == "NO_SHOW"
+                is_srv   = t.get("status") == "SERVING"
+
+                if is_srv:
+                    st.markdown('<div class="sss-alert sss-alert-blue" style="font-size:18px;">🎉 <strong>YOU\'RE BEING SERVED!</strong></div>', unsafe_allow_html=True)
+                elif is_done:
+                    st.markdown(f'<div class="sss-alert sss-alert-green">✅ <strong>Completed</strong> — Thank you!</div>', unsafe_allow_html=True)
+                elif is_ns:
+                    st.markdown('<div class="sss-alert sss-alert-red">❌ <strong>No-Show</strong></div>', unsafe_allow_html=True)
+
+                _sl = {"RESERVED":"📋 RESERVED","ARRIVED":"✅ ARRIVED","SERVING":"🔵 SERVING","COMPLETED":"✅ DONE","NO_SHOW":"❌ NO-SHOW"}
+                st.markdown(f"""<div class="sss-card" style="border-top:4px solid {'#22B8CF' if has_bqms else '#3399CC'};text-align:center;">
+                    <div style="font-size:11px;opacity:.5;">{branch['name'].upper()}</div>
+                    <div style="font-weight:700;margin:4px 0;">{t['category']} — {t['service']}</div>
+                    <span class="sss-badge" style="background:rgba(51,153,204,.15);color:#3399CC;">{_sl.get(t['status'],t['status'])}</span>
+                </div>""", unsafe_allow_html=True)
+
+                if has_bqms:
+                    st.markdown(f'<div class="sss-card" style="text-align:center;"><div style="font-size:11px;opacity:.5;">YOUR BQMS NUMBER</div><div class="sss-bqms">{t["bqmsNumber"]}</div></div>', unsafe_allow_html=True)
+                    if not is_done and not is_ns:
+                        ns_val, ahead, est = wait_estimate(t, fresh, cats)
+                        m1,m2,m3 = st.columns(3)
+                        with m1: st.markdown(f'<div class="sss-metric"><div class="val" style="color:#22B8CF;">{ns_val}</div><div class="lbl">Now Serving</div></div>', unsafe_allow_html=True)
+                        with m2: st.markdown(f'<div class="sss-metric"><div class="val">{t["bqmsNumber"]}</div><div class="lbl">Your #</div></div>', unsafe_allow_html=True)
+                        with m3:
+                            wt = "Next!" if est == 0 else f"~{est}m"
+                            st.markdown(f'<div class="sss-metric"><div class="val">{wt}</div><div class="lbl">Est. Wait</div></div>', unsafe_allow_html=True)
+                else:
+                    if not is_done and not is_ns:
+                        st.markdown(f'<div class="sss-card" style="text-align:center;"><div style="font-size:11px;opacity:.5;">RESERVATION NUMBER</div><div class="sss-resnum">{t["resNum"]}</div></div>', unsafe_allow_html=True)
+                        st.markdown('<div class="sss-alert sss-alert-yellow">⏳ <strong>Waiting for BQMS Number</strong><br/>Staff will assign. Auto-refreshes.</div>', unsafe_allow_html=True)
 
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("🔄 Refresh", use_container_width=True, type="primary"): st.rerun()
-            with c2:
-                if st.button("🔍 Track Another", use_container_width=True):
-                    st.session_state.tracked_id = None; go("track_input")
+                c1, c2 = st.columns(2)
+                with c1:
+                    if st.button("🔄 Refresh", use_container_width=True, type="primary"): st.rerun()
+                with c2:
+                    if st.button("🔍 Track Another", use_container_width=True):
+                        st.session_state.tracked_id = None; go("track_input")
+
+        _tracker_card()
 
 
 # ════════════════════════════════════════════════════════
@@ -512,7 +446,7 @@ elif st.session_state.portal == "staff":
             username = st.text_input("Username", placeholder="staff1, kiosk, th, bh")
             password = st.text_input("Password", type="password")
             if st.form_submit_button("Login", type="primary", use_container_width=True, disabled=locked):
-                users = get_users()
+                users = get_users(private=True)
                 u = next((x for x in users if x["username"].lower() == username.strip().lower() and x.get("active",True)), None)
                 if not u:
                     st.error("❌ User not found.")
@@ -532,20 +466,19 @@ elif st.session_state.portal == "staff":
                     st.session_state.last_activity = time.time()
                     st.rerun()
         st.caption("Default password: **mnd2026**")
+        render_end(_t0)
         st.stop()
 
     # ── AUTHENTICATED ──
     st.session_state.last_activity = time.time()
     user = st.session_state.auth_user
     role = user["role"]
-    branch = get_branch()
-    cats   = get_cats()
-    users  = get_users()
-    qdata  = get_queue()
-    res    = qdata.get("res", [])
+    branch = ctx["branch"]
+    cats   = ctx["cats"]
+    qdata  = ctx["live"]            # whole day (ctx["qdata"]) only for dashboard / Done / No-Show
     bqms_st= qdata.get("bqmsState", {})
     o_stat = qdata.get("oStat", "online")
-    sc     = slot_counts(cats, res)
+    sc     = ctx["sc"]
     is_ro  = role in ("bh","dh")
 
     ROLE_ICONS = {"kiosk":"🏢","staff":"🛡️","th":"👔","bh":"🏛️","dh":"⭐"}
@@ -586,7 +519,7 @@ elif st.session_state.portal == "staff":
                 if len(np1) < 4: st.error("Min 4 chars.")
                 elif np1 != np2: st.error("Mismatch.")
                 else:
-                    all_u = get_users()
+                    all_u = get_users(private=True)
                     for u in all_u:
                         if u["id"] == user["id"]: u["password"] = np1
                     save_users(all_u)
@@ -598,9 +531,9 @@ elif st.session_state.portal == "staff":
     # ══════════════════════════════════════════
     elif tab == "queue":
         # Live indicator
-        st.caption(f"🔄 Live · {len(res)} entries · Auto: {'✅ 15s' if _ar_ok else '❌'} · {now.strftime('%I:%M:%S %p')}")
-
-        unassigned = [r for r in res if not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED")]
+        _sessions, _p90 = load_stats()
+        st.caption(f"🔄 Live · {ctx['summary']['total']} entries · Auto: {'✅ push' if _live else '✅ 15s' if _ar_ok else '❌'} · {now.strftime('%I:%M:%S %p')}"
+                   f" · Load: {PRESSURE_LABELS[_pressure]} ({_sessions} sessions, p90 {_p90:.0f} ms)")
 
         if not is_ro:
             # System status
@@ -611,7 +544,7 @@ elif st.session_state.portal == "staff":
             cur_lbl= _srev.get(o_stat, "🟢 Online")
             new_s  = st.radio("Status:", _sopts, horizontal=True, index=_sopts.index(cur_lbl))
             if _smap[new_s] != o_stat:
-                fq = get_queue(); fq["oStat"] = _smap[new_s]; save_queue(fq); st.rerun()
+                update_queue(lambda q: q.update(oStat=_smap[new_s])); st.rerun()
 
             # Announcement
             if role != "kiosk":
@@ -622,15 +555,19 @@ elif st.session_state.portal == "staff":
                         with ac1: ann_save = st.form_submit_button("📢 Post", type="primary")
                         with ac2: ann_clr = st.form_submit_button("🗑️ Clear")
                         if ann_save:
-                            fb = get_branch(); fb["announcement"] = ann_text.strip(); save_branch(fb)
+                            fb = get_branch(private=True); fb["announcement"] = ann_text.strip(); save_branch(fb)
                             st.success("✅ Posted!"); st.rerun()
                         if ann_clr:
-                            fb = get_branch(); fb["announcement"] = ""; save_branch(fb)
+                            fb = get_branch(private=True); fb["announcement"] = ""; save_branch(fb)
                             st.success("✅ Cleared!"); st.rerun()
 
-            # Unassigned alert
-            if unassigned:
-                st.markdown(f'<div class="sss-alert sss-alert-red" style="font-size:16px;">🔴 <strong>{len(unassigned)} NEED BQMS#</strong></div>', unsafe_allow_html=True)
+            # Unassigned alert (fragment)
+            @live_fragment(run_every=_tick)
+            def _need_bqms_alert():
+                unassigned = data_context(st.session_state)["unassigned"]
+                if unassigned:
+                    st.markdown(f'<div class="sss-alert sss-alert-red" style="font-size:16px;">🔴 <strong>{len(unassigned)} NEED BQMS#</strong></div>', unsafe_allow_html=True)
+            _need_bqms_alert()
 
             # BQMS Now Serving
             with st.expander("🔄 BQMS — Now Serving"):
@@ -647,7 +584,7 @@ elif st.session_state.portal == "staff":
                                 val = st.text_input(f"{c['icon']} {c['short']}", value=cur, key=f"bqms_{c['id']}")
                                 new_bqms[c["id"]] = {"nowServing": val.strip().upper()}
                     if st.form_submit_button("Update", type="primary", use_container_width=True):
-                        fq = get_queue(); fq["bqmsState"] = new_bqms; save_queue(fq)
+                        update_queue(lambda q: q.update(bqmsState=new_bqms))
                         st.success("✅ Updated!"); st.rerun()
 
             # Walk-in registration
@@ -683,19 +620,21 @@ elif st.session_state.portal == "staff":
                         if errs:
                             for e in errs: st.error(f"❌ {e}")
                         else:
-                            fresh = get_queue(); fr = fresh.get("res",[])
-                            fsc = slot_counts(cats, fr)
-                            if is_dup(fr, wlu, wfu, wmu):
-                                st.error("Duplicate.")
-                            elif fsc.get(w_cat["id"],{}).get("remaining",0) <= 0:
-                                st.error("Cap reached.")
-                            else:
-                                slot = next_slot(fr)
+                            entry = {}
+                            def _register(fresh):
+                                fr = fresh.setdefault("res",[])
+                                fsc = slot_counts(cats, fresh)
+                                if is_dup(fresh, wlu, wfu, wmu):
+                                    errs.append("Duplicate."); return False
+                                if fsc.get(w_cat["id"],{}).get("remaining",0) <= 0:
+                                    errs.append("Cap reached."); return False
+                                slot = entry.get("slot") or next_slot()
+                                if slot is None: errs.append("System busy — try again."); return False
                                 rn = f"K-{mmdd()}-{slot:03d}"
                                 bv = wbqms.strip().upper() if wbqms else ""
                                 svc_lbl = w_svc["label"] if w_svc else "Walk-in"
                                 svc_id  = w_svc["id"] if w_svc else "walkin"
-                                entry = {
+                                entry.update({
                                     "id": gen_id(), "slot": slot, "resNum": rn,
                                     "lastName": wlu, "firstName": wfu,
                                     "mi": wmi.strip().upper(), "mobile": wmu,
@@ -708,9 +647,15 @@ elif st.session_state.portal == "staff":
                                     "source": "KIOSK", "issuedAt": now.isoformat(),
                                     "arrivedAt": now.isoformat() if bv else None,
                                     "completedAt": None,
-                                }
-                                fr.append(entry); fresh["res"] = fr; save_queue(fresh)
-                                st.success(f"✅ **{rn}** — Share this number with the member for tracking!")
+                                })
+                                fr.append(entry)
+
+                            if update_queue(_register) is None:
+                                st.error("⚠️ Queue busy — try again.")
+                            elif errs:
+                                st.error(errs[0])
+                            else:
+                                st.success(f"✅ **{entry['resNum']}** — Share this number with the member for tracking!")
                                 st.rerun()
 
         # ── QUEUE LIST ──
@@ -720,95 +665,143 @@ elif st.session_state.portal == "staff":
         qf = _fm[sel_f]
         search = st.text_input("🔍 Search", key="qsearch")
 
-        sorted_res = sorted(res, key=lambda r: (0 if not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED") else 1, r.get("issuedAt","")))
-        filt = sorted_res
-        if qf == "UNASSIGNED": filt = [r for r in filt if not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED")]
-        elif qf == "KIOSK": filt = [r for r in filt if r.get("source") == "KIOSK"]
-        elif qf == "ONLINE": filt = [r for r in filt if r.get("source") == "ONLINE"]
-        elif qf != "all": filt = [r for r in filt if r.get("status") == qf]
-        if search:
-            sl = search.strip().lower()
-            filt = [r for r in filt if sl in r.get("lastName","").lower() or sl in r.get("firstName","").lower() or sl in (r.get("bqmsNumber","") or "").lower() or sl in (r.get("resNum","") or "").lower()]
-
-        st.caption(f"Showing {len(filt)} entries")
-
-        if not filt:
-            if qf == "UNASSIGNED": st.success("✅ All have BQMS#!")
-            else: st.info("No entries.")
+        # Filter + search (shared by the cards and the grid)
+        def _queue_for(qf): return data_context(st.session_state)["live" if qf in LIVE_VIEWS else "qdata"]
+
+        def _filter_queue(q, qf, search):
+            filt = queue_view(q, qf)             # pre-ordered lists from the index
+            if search.strip():
+                hits = search_queue(q, search)      # n-gram index, see shared_data
+                filt = [r for r in filt if r.get("id") in hits]
+            return filt
+
+        # Pager — config.toml [staff] page_size cards per page
+        def _turn_page(step): st.session_state.qpage = st.session_state.get("qpage", 0) + step
+
+        # Queue cards (fragment — a refresh tick redraws only the list)
+        @live_fragment(run_every=_tick)
+        def _queue_cards(qf, search):
+            filt = _filter_queue(_queue_for(qf), qf, search)
+
+            # One page of cards per run; need-BQMS (oldest first) lead page 1
+            if st.session_state.get("_qpage_for") != (qf, search):
+                st.session_state._qpage_for = (qf, search); st.session_state.qpage = 0
+            shown, page, pages = page_slice(filt, st.session_state.get("qpage", 0))
+            st.session_state.qpage = page
+            st.caption(f"Showing {len(shown)} of {len(filt)} entries" if pages > 1 else f"Showing {len(filt)} entries")
+
+            if not filt:
+                if qf == "UNASSIGNED": st.success("✅ All have BQMS#!")
+                else: st.info("No entries.")
+            else:
+                for r in shown:
+                    needs_b = not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED")
+                    bdr = "#ef4444" if needs_b else "rgba(128,128,128,.15)"
+                    src = "🏢" if r.get("source") == "KIOSK" else "📱"
+                    pri = "⭐" if r.get("priority") == "priority" else ""
+                    _sl = {"RESERVED":"📋 RES","ARRIVED":"✅ ARR","SERVING":"🔵 SRV","COMPLETED":"✅ DONE","NO_SHOW":"❌ NS"}
+                    bqms_h = f'<div style="font-family:monospace;font-size:20px;font-weight:900;color:#22B8CF;margin-top:4px;">BQMS: {r["bqmsNumber"]}</div>' if r.get("bqmsNumber") else ""
+
+                    st.markdown(f"""<div class="sss-card" style="border-left:4px solid {bdr};">
+                        <div style="display:flex;justify-content:space-between;">
+                            <div><span style="font-family:monospace;font-size:15px;font-weight:800;color:#3399CC;">{r.get('resNum','')}</span>
+                                <span style="font-size:11px;opacity:.5;margin-left:6px;">{src}</span>{pri}<br/>
+                                <strong>{r.get('catIcon','')} {r['lastName']}, {r['firstName']} {r.get('mi','')}</strong><br/>
+                                <span style="font-size:12px;opacity:.6;">{r.get('category','')} → {r.get('service','')}</span>
+                                {f'<br/><span style="font-size:11px;opacity:.5;">📱 {r["mobile"]}</span>' if r.get('mobile') else ''}
+                            </div>
+                            <div style="text-align:right;"><span class="sss-badge" style="background:rgba(51,153,204,.15);color:#3399CC;">{_sl.get(r['status'],r['status'])}</span>{bqms_h}</div>
+                        </div></div>""", unsafe_allow_html=True)
+
+                    if not is_ro:
+                        if needs_b:
+                            st.markdown(f"""<div style="background:rgba(220,53,69,.08);border:1px solid rgba(220,53,69,.25);border-radius:8px;padding:10px 14px;margin-bottom:8px;">
+                                <span style="font-size:12px;font-weight:700;color:#ef4444;">🎫 Assign BQMS for {r.get('resNum','')}</span><br/>
+                                <span style="font-size:11px;opacity:.6;">Type number from the physical BQMS machine</span></div>""", unsafe_allow_html=True)
+                            ac1,ac2 = st.columns([3,1])
+                            with ac1: bv = st.text_input(f"BQMS# for {r.get('resNum','')}", key=f"a_{r['id']}", placeholder="e.g., L-023")
+                            with ac2:
+                                st.markdown("<div style='margin-top:6px;'></div>", unsafe_allow_html=True)
+                                if st.button("🎫 Assign", key=f"ba_{r['id']}", type="primary", use_container_width=True):
+                                    if bv.strip():
+                                        after_action(assign_bqms(r["id"], bv))
+                                    else:
+                                        st.warning("Enter BQMS# first.")
+                            if st.button("❌ No-Show", key=f"ns_{r['id']}", use_container_width=True):
+                                after_action(mark_no_show([r["id"]]))
+
+                        elif r.get("status") == "ARRIVED":
+                            ac1,ac2,ac3 = st.columns(3)
+                            with ac1:
+                                if st.button("🔵 Serving", key=f"srv_{r['id']}", use_container_width=True):
+                                    after_action(set_status(r["id"], "SERVING"))
+                            with ac2:
+                                if st.button("✅ Complete", key=f"dn_{r['id']}", use_container_width=True):
+                                    after_action(set_status(r["id"], "COMPLETED"))
+                            with ac3:
+                                if st.button("❌ NS", key=f"ns2_{r['id']}", use_container_width=True):
+                                    after_action(mark_no_show([r["id"]]))
+
+                        elif r.get("status") == "SERVING":
+                            if st.button("✅ Complete", key=f"dn2_{r['id']}", type="primary", use_container_width=True):
+                                after_action(set_status(r["id"], "COMPLETED"))
+                    st.markdown("")
+
+                if pages > 1:
+                    p1,p2,p3 = st.columns([1,2,1])
+                    with p1: st.button("◀ Prev", key="qpage_prev", disabled=page == 0, on_click=_turn_page, args=(-1,), use_container_width=True)
+                    with p2: st.markdown(f"<div style='text-align:center;padding-top:8px;font-size:13px;opacity:.6;'>Page {page+1} of {pages}</div>", unsafe_allow_html=True)
+                    with p3: st.button("Next ▶", key="qpage_next", disabled=page >= pages-1, on_click=_turn_page, args=(1,), use_container_width=True)
+
+        # Bulk-edit grid — a snapshot of the filtered rows; one save commits
+        # every BQMS#/status change, rows changed elsewhere are reported
+        def _bulk_grid(qf, search):
+            if st.session_state.get("_grid_for") != (qf, search) or "_grid_rows" not in st.session_state:
+                q = get_queue(active_only=qf in LIVE_VIEWS)
+                st.session_state._grid_for = (qf, search); st.session_state._grid_ver = q.get("version", 0)
+                st.session_state._grid_n = st.session_state.get("_grid_n", 0) + 1
+                st.session_state._grid_rows = [{"id": r["id"], "Res#": r.get("resNum",""), "Name": f"{r['lastName']}, {r['firstName']}",
+                                                "Service": f"{r.get('category','')} → {r.get('service','')}",
+                                                "BQMS#": r.get("bqmsNumber") or "", "Status": r.get("status")}
+                                               for r in _filter_queue(q, qf, search)]
+            rows = st.session_state._grid_rows
+            msg = st.session_state.pop("_grid_msg", None)
+            if msg:
+                if msg[0]: st.success(f"✅ Saved {msg[0]} row(s).")
+                if msg[1]: st.warning("⚠️ Not saved — changed elsewhere since the grid was loaded:\n\n" + "\n".join(f"- **{rn}** — {why}" for rn, why in msg[1]))
+            if data_context(st.session_state)["summary"]["version"] != st.session_state._grid_ver:
+                st.caption("ℹ️ Queue changed since this grid was loaded — rows changed elsewhere will be reported, not overwritten.")
+            if not rows:
+                st.info("No entries."); return
+            with st.form("bulk_grid"):
+                edited = st.data_editor(rows, key=f"grid_{st.session_state._grid_n}", hide_index=True, num_rows="fixed", use_container_width=True,
+                                        column_config={"id": None, "Res#": st.column_config.TextColumn(disabled=True),
+                                                       "Name": st.column_config.TextColumn(disabled=True),
+                                                       "Service": st.column_config.TextColumn(disabled=True),
+                                                       "BQMS#": st.column_config.TextColumn(max_chars=12),
+                                                       "Status": st.column_config.SelectboxColumn(options=list(STATUSES), required=True)})
+                g1,g2 = st.columns(2)
+                with g1: commit = st.form_submit_button("💾 Commit changes", type="primary", use_container_width=True)
+                with g2: reload = st.form_submit_button("🔄 Reload grid", use_container_width=True)
+            if reload:
+                del st.session_state["_grid_rows"]; st.rerun()
+            if commit:
+                edits = {o["id"]: ({"bqmsNumber": o["BQMS#"] or None, "status": o["Status"]}, {"bqmsNumber": n["BQMS#"], "status": n["Status"]})
+                         for o, n in zip(rows, edited)
+                         if (n["BQMS#"] or "").strip().upper() != o["BQMS#"] or n["Status"] != o["Status"]}
+                if not edits:
+                    st.info("No changes to commit."); return
+                q, conflicts = apply_edits(edits)
+                if q is None:
+                    st.error("⚠️ Queue busy — nothing was saved. Try again."); return
+                rn = {r["id"]: r["Res#"] for r in rows}
+                st.session_state._grid_msg = (len(edits) - len(conflicts), [(rn[eid], why) for eid, why in conflicts.items()])
+                del st.session_state["_grid_rows"]; st.rerun()
+
+        if not is_ro and st.radio("View:", ["🗂 Cards", "📝 Bulk-edit grid"], horizontal=True, key="qview") != "🗂 Cards":
+            _bulk_grid(qf, search)
         else:
-            for r in filt:
-                needs_b = not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED")
-                bdr = "#ef4444" if needs_b else "rgba(128,128,128,.15)"
-                src = "🏢" if r.get("source") == "KIOSK" else "📱"
-                pri = "⭐" if r.get("priority") == "priority" else ""
-                _sl = {"RESERVED":"📋 RES","ARRIVED":"✅ ARR","SERVING":"🔵 SRV","COMPLETED":"✅ DONE","NO_SHOW":"❌ NS"}
-                bqms_h = f'<div style="font-family:monospace;font-size:20px;font-weight:900;color:#22B8CF;margin-top:4px;">BQMS: {r["bqmsNumber"]}</div>' if r.get("bqmsNumber") else ""
-
-                st.markdown(f"""<div class="sss-card" style="border-left:4px solid {bdr};">
-                    <div style="display:flex;justify-content:space-between;">
-                        <div><span style="font-family:monospace;font-size:15px;font-weight:800;color:#3399CC;">{r.get('resNum','')}</span>
-                            <span style="font-size:11px;opacity:.5;margin-left:6px;">{src}</span>{pri}<br/>
-                            <strong>{r.get('catIcon','')} {r['lastName']}, {r['firstName']} {r.get('mi','')}</strong><br/>
-                            <span style="font-size:12px;opacity:.6;">{r.get('category','')} → {r.get('service','')}</span>
-                            {f'<br/><span style="font-size:11px;opacity:.5;">📱 {r["mobile"]}</span>' if r.get('mobile') else ''}
-                        </div>
-                        <div style="text-align:right;"><span class="sss-badge" style="background:rgba(51,153,204,.15);color:#3399CC;">{_sl.get(r['status'],r['status'])}</span>{bqms_h}</div>
-                    </div></div>""", unsafe_allow_html=True)
-
-                if not is_ro:
-                    if needs_b:
-                        st.markdown(f"""<div style="background:rgba(220,53,69,.08);border:1px solid rgba(220,53,69,.25);border-radius:8px;padding:10px 14px;margin-bottom:8px;">
-                            <span style="font-size:12px;font-weight:700;color:#ef4444;">🎫 Assign BQMS for {r.get('resNum','')}</span><br/>
-                            <span style="font-size:11px;opacity:.6;">Type number from the physical BQMS machine</span></div>""", unsafe_allow_html=True)
-                        ac1,ac2 = st.columns([3,1])
-                        with ac1: bv = st.text_input(f"BQMS# for {r.get('resNum','')}", key=f"a_{r['id']}", placeholder="e.g., L-023")
-                        with ac2:
-                            st.markdown("<div style='margin-top:6px;'></div>", unsafe_allow_html=True)
-                            if st.button("🎫 Assign", key=f"ba_{r['id']}", type="primary", use_container_width=True):
-                                if bv.strip():
-                                    fq = get_queue()
-                                    for fr in fq["res"]:
-                                        if fr["id"] == r["id"]:
-                                            fr["bqmsNumber"] = bv.strip().upper()
-                                            fr["status"] = "ARRIVED"
-                                            fr["arrivedAt"] = now.isoformat()
-                                    save_queue(fq); st.rerun()
-                                else:
-                                    st.warning("Enter BQMS# first.")
-                        if st.button("❌ No-Show", key=f"ns_{r['id']}", use_container_width=True):
-                            fq = get_queue()
-                            for fr in fq["res"]:
-                                if fr["id"] == r["id"]: fr["status"] = "NO_SHOW"
-                            save_queue(fq); st.rerun()
-
-                    elif r.get("status") == "ARRIVED":
-                        ac1,ac2,ac3 = st.columns(3)
-                        with ac1:
-                            if st.button("🔵 Serving", key=f"srv_{r['id']}", use_container_width=True):
-                                fq = get_queue()
-                                for fr in fq["res"]:
-                                    if fr["id"] == r["id"]: fr["status"] = "SERVING"
-                                save_queue(fq); st.rerun()
-                        with ac2:
-                            if st.button("✅ Complete", key=f"dn_{r['id']}", use_container_width=True):
-                                fq = get_queue()
-                                for fr in fq["res"]:
-                                    if fr["id"] == r["id"]: fr["status"] = "COMPLETED"; fr["completedAt"] = now.isoformat()
-                                save_queue(fq); st.rerun()
-                        with ac3:
-                            if st.button("❌ NS", key=f"ns2_{r['id']}", use_container_width=True):
-                                fq = get_queue()
-                                for fr in fq["res"]:
-                                    if fr["id"] == r["id"]: fr["status"] = "NO_SHOW"
-                                save_queue(fq); st.rerun()
-
-                    elif r.get("status") == "SERVING":
-                        if st.button("✅ Complete", key=f"dn2_{r['id']}", type="primary", use_container_width=True):
-                            fq = get_queue()
-                            for fr in fq["res"]:
-                                if fr["id"] == r["id"]: fr["status"] = "COMPLETED"; fr["completedAt"] = now.isoformat()
-                            save_queue(fq); st.rerun()
-                st.markdown("")
+            _queue_cards(qf, search)
 
         st.markdown("---")
         if st.button("🔄 Refresh Queue", use_container_width=True): st.rerun()
@@ -819,7 +812,7 @@ elif st.session_state.portal == "staff":
         atabs = st.tabs(["👥 Users","📋 Categories","📊 Caps","🏢 Branch","📢 Announcement"])
 
         with atabs[0]:
-            for u in users:
+            for u in ctx["users"]:
                 rl = ROLE_LABELS.get(u["role"], u["role"])
                 st.markdown(f"**{u['displayName']}** — {rl} · `{u['username']}` · {'🟢' if u.get('active',True) else '🔴'}")
 
@@ -836,7 +829,7 @@ elif st.session_state.portal == "staff":
                     s = sc.get(cat["id"],{"used":0})
                     new_caps[cat["id"]] = st.number_input(f"{cat['icon']} {cat['short']} (used: {s['used']})", value=cat["cap"], min_value=1, key=f"cap_{cat['id']}")
                 if st.form_submit_button("Save Caps", type="primary"):
-                    fc = get_cats()
+                    fc = get_cats(private=True)
                     for c in fc:
                         if c["id"] in new_caps: c["cap"] = new_caps[c["id"]]
                     save_cats(fc); st.success("✅ Saved!"); st.rerun()
@@ -847,23 +840,22 @@ elif st.session_state.portal == "staff":
                 ba = st.text_input("Address", value=branch["address"])
                 bh = st.text_input("Hours", value=branch["hours"])
                 if st.form_submit_button("Save", type="primary"):
-                    fb = get_branch(); fb.update({"name":bn,"address":ba,"hours":bh}); save_branch(fb)
+                    fb = get_branch(private=True); fb.update({"name":bn,"address":ba,"hours":bh}); save_branch(fb)
                     st.success("✅ Saved!"); st.rerun()
 
         with atabs[4]:
             with st.form("ann2"):
                 ann = st.text_area("📢 Announcement", value=branch.get("announcement",""))
                 if st.form_submit_button("Save", type="primary"):
-                    fb = get_branch(); fb["announcement"] = ann; save_branch(fb)
+                    fb = get_branch(private=True); fb["announcement"] = ann; save_branch(fb)
                     st.success("✅ Saved!"); st.rerun()
 
     # ── DASHBOARD ──
     elif tab == "dash" and role in ("th","bh","dh"):
         st.subheader("📊 Dashboard")
-        tot = len(res); done = len([r for r in res if r.get("status")=="COMPLETED"])
-        ns = len([r for r in res if r.get("status")=="NO_SHOW"])
-        onl = len([r for r in res if r.get("source")=="ONLINE"])
-        ksk = len([r for r in res if r.get("source")=="KIOSK"])
+        stats = ctx["stats"]
+        tot, done, ns = stats["total"], stats["done"], stats["no_show"]
+        onl, ksk = stats["online"], stats["kiosk"]
 
         c1,c2,c3 = st.columns(3)
         with c1: st.metric("Total", tot)
@@ -881,7 +873,7 @@ elif st.session_state.portal == "staff":
         out = io.StringIO()
         w = csv.writer(out)
         w.writerow(["Res#","Source","LastName","FirstName","Category","Service","Status","BQMS#","Mobile","Priority"])
-        for r in res:
+        for r in ctx["qdata"].get("res", []):
             w.writerow([r.get("resNum",""),r.get("source",""),r.get("lastName",""),r.get("firstName",""),r.get("category",""),r.get("service",""),r.get("status",""),r.get("bqmsNumber",""),r.get("mobile",""),r.get("priority","")])
         st.download_button("📥 Export CSV", data=out.getvalue(), file_name=f"MabiliSSS_{date.today().isoformat()}.csv", mime="text/csv", use_container_width=True)
 
@@ -890,3 +882,4 @@ st.markdown("---")
 st.markdown(f"""<div style="text-align:center;font-size:10px;opacity:.3;padding:8px;">
     RPT / SSS Gingoog Branch · MabiliSSS Queue {VER} · 📂 {_DIR}
 </div>""", unsafe_allow_html=True)
+render_end(_t0)
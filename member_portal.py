@@ -11,9 +11,12 @@ import streamlit as st
 from datetime import datetime
 from shared_data import (
     VER, SSS_CSS, OSTATUS_META,
-    get_branch, get_categories, get_queue, save_queue,
+    get_branch, get_categories, update_queue, queue_summary,
+    queue_slot_counts, get_entry,
     slot_counts, next_slot_num, is_duplicate, gen_id,
-    today_iso, today_mmdd, format_time_12h,
+    today_iso, today_mmdd, format_time_12h, reuse_view, watch_session,
+    live_fragment, tracker_refresh, wait_estimate,
+    render_start, render_end, pressure_level, pressure_interval, PRESSURE_LABELS,
 )
 
 # ── PAGE CONFIG ──
@@ -36,16 +39,24 @@ _DEFAULTS = {
 for k, v in _DEFAULTS.items():
     if k not in st.session_state:
         st.session_state[k] = v
-
-# ── LOAD DATA (fresh every render) ──
-branch = get_branch()
-cats   = get_categories()
-qdata  = get_queue()
-res    = qdata.get("res", [])
-bqms_st= qdata.get("bqmsState", {})
-o_stat = qdata.get("oStat", "online")
+_t0 = render_start(st.session_state.setdefault("_load_key", gen_id()))
+
+# ── LOAD DATA (re-read only when a save changed data_version()) ──
+#  Every screen needs the branch, categories and the day's summary
+#  (status, now-serving, counts); the reservation list itself is only
+#  ever touched through narrow reads — queue_slot_counts() on
+#  select_cat, get_entry() on track_input and the tracker.
+def _build_view():
+    return {"branch": get_branch(), "cats": get_categories(),
+            "summary": queue_summary()}
+
+view   = reuse_view(st.session_state, _build_view)
+branch = view["branch"]
+cats   = view["cats"]
+qsum   = view["summary"]
+bqms_st= qsum["bqmsState"]
+o_stat = qsum["oStat"]
 is_open= o_stat != "offline"
-sc     = slot_counts(cats, res)
 now    = datetime.now()
 
 def go(scr):
@@ -55,14 +66,31 @@ def go(scr):
 
 # ═══════════════════════════════════════════════════
 #  AUTO-REFRESH — ALL SCREENS (status, BQMS, announcements)
+#  Pushed by the shared_data watcher as soon as data changes.
+#  Without push the tracker card refreshes itself (fragment) at a
+#  cadence set by the member's place in line — see tracker_refresh();
+#  other screens fall back to a 20s full-page st_autorefresh.
+#  Under load (pressure_level() > 0) members give up push and every
+#  interval is stretched, leaving headroom for the staff portal.
 # ═══════════════════════════════════════════════════
-_autorefresh_ok = False
-try:
-    from streamlit_autorefresh import st_autorefresh
-    st_autorefresh(interval=20_000, limit=None, key="member_autorefresh")
-    _autorefresh_ok = True
-except ImportError:
-    pass  # manual Refresh still available; warning shown below
+_pressure = pressure_level()
+_live  = watch_session(enabled=_pressure == 0)
+_every = 20
+if st.session_state.screen == "tracker":
+    _t = get_entry(st.session_state.tracked_id)
+    if _t:
+        _every = tracker_refresh(_t, qsum, cats)      # None → finished, stop
+_every = pressure_interval(_every, _pressure)
+_tick = None if _live else _every
+_autorefresh_ok = (_live or _every is None
+                   or st.session_state.screen == "tracker")
+if not _autorefresh_ok:
+    try:
+        from streamlit_autorefresh import st_autorefresh
+        st_autorefresh(interval=_every * 1000, limit=None, key="member_autorefresh")
+        _autorefresh_ok = True
+    except ImportError:
+        pass  # manual Refresh still available; warning shown below
 
 
 # ═══════════════════════════════════════════════════
@@ -126,8 +154,8 @@ screen = st.session_state.screen
 #  HOME
 # ═══════════════════════════════════════════════════
 if screen == "home":
-    active_q = len([r for r in res if r.get("status") not in ("COMPLETED","NO_SHOW")])
-    done_q   = len([r for r in res if r.get("status") == "COMPLETED"])
+    active_q = qsum["active"]
+    done_q   = qsum["done"]
 
     c1, c2 = st.columns(2)
     with c1:
@@ -185,6 +213,7 @@ elif screen == "select_cat":
         go("home")
     st.subheader("Step 1: Choose Transaction")
 
+    sc = queue_slot_counts(cats)
     for cat in cats:
         s = sc.get(cat["id"], {"remaining": cat["cap"], "cap": cat["cap"]})
         full = s["remaining"] <= 0
@@ -284,30 +313,32 @@ elif screen == "member_form":
                 first_up = first_name.strip().upper()
                 mob      = mobile.strip()
 
-                # Re-read fresh data to prevent race conditions
-                fresh     = get_queue()
-                fresh_res = fresh.get("res", [])
-                fresh_sc  = slot_counts(cats, fresh_res)
-
                 errors = []
                 if not last_up:     errors.append("Last Name is required.")
                 if not first_up:    errors.append("First Name is required.")
                 if not mob or len(mob) < 10:
                     errors.append("Valid mobile number required (min 10 digits).")
                 if not consent:     errors.append("Please check the privacy consent.")
-                s = fresh_sc.get(cat["id"], {"remaining":0, "used":0})
-                if s["remaining"] <= 0:
-                    errors.append(f"Slots full for {cat['label']}.")
-                if is_duplicate(fresh_res, last_up, first_up, mob):
-                    errors.append("You already have an active reservation today.")
 
-                if errors:
-                    for e in errors:
-                        st.error(f"❌ {e}")
-                else:
-                    slot = next_slot_num(fresh_res)
+                # Cap + duplicate checks run under the queue lock so two
+                # members can never take the last slot at the same time
+                entry = {}
+                def _reserve(fresh):
+                    fresh_res = fresh.setdefault("res", [])
+                    s = slot_counts(cats, fresh).get(cat["id"], {"remaining":0, "used":0})
+                    if s["remaining"] <= 0:
+                        errors.append(f"Slots full for {cat['label']}.")
+                    if is_duplicate(fresh, last_up, first_up, mob):
+                        errors.append("You already have an active reservation today.")
+                    if errors:
+                        return False
+                    # Keep the number already drawn if this runs again
+                    slot = entry.get("slot") or next_slot_num()
+                    if slot is None:
+                        errors.append("System busy — please tap Reserve again.")
+                        return False
                     rn   = f"R-{today_mmdd()}-{slot:03d}"
-                    entry = {
+                    entry.update({
                         "id": gen_id(), "slot": slot, "resNum": rn,
                         "lastName": last_up, "firstName": first_up,
                         "mi": mi.strip().upper(), "mobile": mob,
@@ -318,10 +349,16 @@ elif screen == "member_form":
                         "source": "ONLINE",
                         "issuedAt": datetime.now().isoformat(),
                         "arrivedAt": None, "completedAt": None,
-                    }
+                    })
                     fresh_res.append(entry)
-                    fresh["res"] = fresh_res
-                    save_queue(fresh)
+
+                if not errors and update_queue(_reserve) is None:
+                    errors.append("System busy — please tap Reserve again.")
+
+                if errors:
+                    for e in errors:
+                        st.error(f"❌ {e}")
+                else:
                     st.session_state.ticket = entry
                     go("ticket")
 
@@ -404,31 +441,15 @@ elif screen == "track_input":
 
         if st.form_submit_button("🔍 Find My Queue", type="primary",
                                   use_container_width=True):
-            fresh     = get_queue()
-            fresh_res = fresh.get("res", [])
             v = track_val.strip().upper()
             if not v:
                 st.error("Please enter a value.")
             else:
-                found = None
+                # Prefer active match, fallback to any
                 if "Mobile" in track_mode:
-                    v_raw = track_val.strip()
-                    # Prefer active match, fallback to any
-                    for r in fresh_res:
-                        if r.get("mobile") == v_raw and r.get("status") not in ("COMPLETED","NO_SHOW"):
-                            found = r; break
-                    if not found:
-                        for r in fresh_res:
-                            if r.get("mobile") == v_raw:
-                                found = r; break
+                    found = get_entry(mobile=track_val.strip())
                 else:
-                    for r in fresh_res:
-                        if r.get("resNum") == v and r.get("status") not in ("COMPLETED","NO_SHOW"):
-                            found = r; break
-                    if not found:
-                        for r in fresh_res:
-                            if r.get("resNum") == v:
-                                found = r; break
+                    found = get_entry(res_num=v)
 
                 if not found:
                     st.error("❌ Not found. Check your input and try again.")
@@ -438,123 +459,124 @@ elif screen == "track_input":
 
 
 # ═══════════════════════════════════════════════════
-#  LIVE TRACKER  (auto-refreshes via streamlit_autorefresh)
+#  LIVE TRACKER  (reruns on every queue change — see AUTO-REFRESH)
 # ═══════════════════════════════════════════════════
 elif screen == "tracker":
-    tid = st.session_state.tracked_id
-    fresh     = get_queue()
-    fresh_res = fresh.get("res", [])
-    fresh_bq  = fresh.get("bqmsState", {})
-
-    t = next((r for r in fresh_res if r.get("id") == tid), None)
-    if not t:
-        st.error("❌ Entry not found.")
-        if st.button("← Try Again"):
-            go("track_input")
-    else:
-        has_bqms   = bool(t.get("bqmsNumber"))
-        is_done    = t.get("status") == "COMPLETED"
-        is_ns      = t.get("status") == "NO_SHOW"
-        is_serving = t.get("status") == "SERVING"
-
-        # Status banners
-        if is_serving:
-            st.markdown("""<div class="sss-alert sss-alert-blue" style="font-size:18px;">
-                🎉 <strong>YOU'RE BEING SERVED!</strong><br/>
-                Proceed to the counter now.
-            </div>""", unsafe_allow_html=True)
-        elif is_done:
-            st.markdown(f"""<div class="sss-alert sss-alert-green">
-                ✅ <strong>Completed</strong><br/>
-                Thank you for visiting {branch['name']}!
-            </div>""", unsafe_allow_html=True)
-        elif is_ns:
-            st.markdown("""<div class="sss-alert sss-alert-red">
-                ❌ <strong>No-Show</strong><br/>
-                Please create a new reservation.
-            </div>""", unsafe_allow_html=True)
-
-        # Main info card
-        _slabels = {
-            "RESERVED":"📋 RESERVED", "ARRIVED":"✅ ARRIVED",
-            "SERVING":"🔵 NOW SERVING", "COMPLETED":"✅ DONE", "NO_SHOW":"❌ NO-SHOW",
-        }
-        st.markdown(f"""<div class="sss-card" style="border-top:4px solid {'#22B8CF' if has_bqms else '#3399CC'};text-align:center;">
-            <div style="font-size:11px;opacity:0.5;letter-spacing:2px;">{branch['name'].upper()}</div>
-            <div style="font-weight:700;margin:4px 0;">{t['category']} — {t['service']}</div>
-            <span class="sss-badge" style="background:rgba(51,153,204,0.15);color:#3399CC;">
-                {_slabels.get(t['status'], t['status'])}</span>
-        </div>""", unsafe_allow_html=True)
+    # Only this card reruns on the timer — header, CSS and banners stay put
+    @live_fragment(run_every=_tick)
+    def _tracker_card():
+        view   = reuse_view(st.session_state, _build_view)
+        branch = view["branch"]
+        cats   = view["cats"]
+        now    = datetime.now()
+
+        tid = st.session_state.tracked_id
+        fresh  = view["summary"]     # bqmsState is all wait_estimate reads
+
+        t = get_entry(tid)
+        if t and not _live and pressure_interval(tracker_refresh(t, fresh, cats), _pressure) != _every:
+            st.rerun()          # into another refresh step / got a BQMS# / finished
+        if not t:
+            st.error("❌ Entry not found.")
+            if st.button("← Try Again"):
+                go("track_input")
+        else:
+            has_bqms   = bool(t.get("bqmsNumber"))
+            is_done    = t.get("status") == "COMPLETED"
+            is_ns      = t.get("status") == "NO_SHOW"
+            is_serving = t.get("status") == "SERVING"
+
+            # Status banners
+            if is_serving:
+                st.markdown("""<div class="sss-alert sss-alert-blue" style="font-size:18px;">
+                    🎉 <strong>YOU'RE BEING SERVED!</strong><br/>
+                    Proceed to the counter now.
+                </div>""", unsafe_allow_html=True)
+            elif is_done:
+                st.markdown(f"""<div class="sss-alert sss-alert-green">
+                    ✅ <strong>Completed</strong><br/>
+                    Thank you for visiting {branch['name']}!
+                </div>""", unsafe_allow_html=True)
+            elif is_ns:
+                st.markdown("""<div class="sss-alert sss-alert-red">
+                    ❌ <strong>No-Show</strong><br/>
+                    Please create a new reservation.
+                </div>""", unsafe_allow_html=True)
 
-        if has_bqms:
-            st.markdown(f"""<div class="sss-card" style="text-align:center;">
-                <div style="font-size:11px;opacity:0.5;">YOUR BQMS QUEUE NUMBER</div>
-                <div class="sss-bqms">{t['bqmsNumber']}</div>
+            # Main info card
+            _slabels = {
+                "RESERVED":"📋 RESERVED", "ARRIVED":"✅ ARRIVED",
+                "SERVING":"🔵 NOW SERVING", "COMPLETED":"✅ DONE", "NO_SHOW":"❌ NO-SHOW",
+            }
+            st.markdown(f"""<div class="sss-card" style="border-top:4px solid {'#22B8CF' if has_bqms else '#3399CC'};text-align:center;">
+                <div style="font-size:11px;opacity:0.5;letter-spacing:2px;">{branch['name'].upper()}</div>
+                <div style="font-weight:700;margin:4px 0;">{t['category']} — {t['service']}</div>
+                <span class="sss-badge" style="background:rgba(51,153,204,0.15);color:#3399CC;">
+                    {_slabels.get(t['status'], t['status'])}</span>
             </div>""", unsafe_allow_html=True)
 
-            if not is_done and not is_ns:
-                cat_obj = next((c for c in cats if c["id"] == t.get("categoryId")), None)
-                bq      = fresh_bq.get(t.get("categoryId",""), {})
-                ns_val  = bq.get("nowServing", "—")
-                avg     = cat_obj["avgTime"] if cat_obj else 10
-                ahead   = 0
-                try:
-                    ns_num = int("".join(filter(str.isdigit, str(ns_val))))
-                    my_num = int("".join(filter(str.isdigit, str(t["bqmsNumber"]))))
-                    ahead  = max(0, my_num - ns_num)
-                except (ValueError, TypeError):
-                    pass
-                est = ahead * avg
-
-                m1, m2, m3 = st.columns(3)
-                with m1:
-                    st.markdown(f"""<div class="sss-metric">
-                        <div class="val" style="color:#22B8CF;">{ns_val}</div>
-                        <div class="lbl">Now Serving</div></div>""", unsafe_allow_html=True)
-                with m2:
-                    st.markdown(f"""<div class="sss-metric">
-                        <div class="val">{t['bqmsNumber']}</div>
-                        <div class="lbl">Your #</div></div>""", unsafe_allow_html=True)
-                with m3:
-                    wait_txt = "Next!" if est == 0 else f"~{est}m"
-                    st.markdown(f"""<div class="sss-metric">
-                        <div class="val">{wait_txt}</div>
-                        <div class="lbl">Est. Wait</div></div>""", unsafe_allow_html=True)
-        else:
-            if not is_done and not is_ns:
+            if has_bqms:
                 st.markdown(f"""<div class="sss-card" style="text-align:center;">
-                    <div style="font-size:11px;opacity:0.5;">RESERVATION NUMBER</div>
-                    <div class="sss-resnum">{t['resNum']}</div>
-                </div>""", unsafe_allow_html=True)
-                st.markdown("""<div class="sss-alert sss-alert-yellow">
-                    ⏳ <strong>Waiting for BQMS Number</strong><br/>
-                    Staff will assign your number. This page auto-refreshes.
+                    <div style="font-size:11px;opacity:0.5;">YOUR BQMS QUEUE NUMBER</div>
+                    <div class="sss-bqms">{t['bqmsNumber']}</div>
                 </div>""", unsafe_allow_html=True)
 
-        # Nav
-        c1, c2 = st.columns(2)
-        with c1:
-            if st.button("🔄 Refresh Now", use_container_width=True, type="primary"):
-                st.rerun()
-        with c2:
-            if st.button("🔍 Track Another", use_container_width=True):
-                st.session_state.tracked_id = None
-                go("track_input")
+                if not is_done and not is_ns:
+                    ns_val, ahead, est = wait_estimate(t, fresh, cats)
+
+                    m1, m2, m3 = st.columns(3)
+                    with m1:
+                        st.markdown(f"""<div class="sss-metric">
+                            <div class="val" style="color:#22B8CF;">{ns_val}</div>
+                            <div class="lbl">Now Serving</div></div>""", unsafe_allow_html=True)
+                    with m2:
+                        st.markdown(f"""<div class="sss-metric">
+                            <div class="val">{t['bqmsNumber']}</div>
+                            <div class="lbl">Your #</div></div>""", unsafe_allow_html=True)
+                    with m3:
+                        wait_txt = "Next!" if est == 0 else f"~{est}m"
+                        st.markdown(f"""<div class="sss-metric">
+                            <div class="val">{wait_txt}</div>
+                            <div class="lbl">Est. Wait</div></div>""", unsafe_allow_html=True)
+            else:
+                if not is_done and not is_ns:
+                    st.markdown(f"""<div class="sss-card" style="text-align:center;">
+                        <div style="font-size:11px;opacity:0.5;">RESERVATION NUMBER</div>
+                        <div class="sss-resnum">{t['resNum']}</div>
+                    </div>""", unsafe_allow_html=True)
+                    st.markdown("""<div class="sss-alert sss-alert-yellow">
+                        ⏳ <strong>Waiting for BQMS Number</strong><br/>
+                        Staff will assign your number. This page auto-refreshes.
+                    </div>""", unsafe_allow_html=True)
+
+            # Nav
+            c1, c2 = st.columns(2)
+            with c1:
+                if st.button("🔄 Refresh Now", use_container_width=True, type="primary"):
+                    st.rerun()
+            with c2:
+                if st.button("🔍 Track Another", use_container_width=True):
+                    st.session_state.tracked_id = None
+                    go("track_input")
+
+            if not is_done and not is_ns:
+                st.caption(f"🔄 {'Live — updates instantly' if _live else f'Auto-refreshes every {_every}s'} · "
+                           f"Last: {now.strftime('%I:%M:%S %p')}"
+                           + (f" · Server {PRESSURE_LABELS[_pressure]} — slower updates" if _pressure else ""))
 
-        if not is_done and not is_ns:
-            st.caption(f"🔄 Page auto-refreshes every 20s · "
-                       f"Last: {now.strftime('%I:%M:%S %p')}")
+    _tracker_card()
 
 
 # ═══════════════════════════════════════════════════
 #  FOOTER + SYNC DIAGNOSTIC
 # ═══════════════════════════════════════════════════
-from shared_data import DATA_DIR
-_qf = DATA_DIR / f"queue_{now.strftime('%Y-%m-%d')}.json"
+from shared_data import DATA_DIR, storage_info
+_qs = storage_info()
 st.markdown("---")
 st.markdown(f"""<div style="text-align:center;font-size:10px;opacity:0.4;padding:8px;">
     RPT / SSS Gingoog Branch · MabiliSSS Queue {VER}<br/>
-    🔗 Data: <code>{DATA_DIR}</code> · Q: <code>{_qf.name}</code>
-    ({len(res)} entries) · Status: {o_stat}
-    · Auto-refresh: {'✅' if _autorefresh_ok else '❌ NOT INSTALLED'}
+    🔗 Data: <code>{DATA_DIR}</code> · Q: <code>{_qs['label']}</code> · {_qs['bytes'] // 1024} KB
+    ({qsum['total']} entries) · Status: {o_stat}
+    · Auto-refresh: {'✅ push' if _live else f'✅ {_every or 20}s' if _autorefresh_ok else '❌ NOT INSTALLED'}
 </div>""", unsafe_allow_html=True)
+render_end(_t0)
@@ -0,0 +1,30 @@
+"""
+═══════════════════════════════════════════════════════════════
+ MabiliSSS Queue — ONE-SHOT SQLITE IMPORT
+ Copies data/branch.json, categories.json, users.json and every
+ data/queue_*.json (plus any unfolded journal) into data/mabilisss.db.
+ Usage: python3 migrate_sqlite.py
+ Then set  [storage] mode = "sqlite"  in config.toml.
+═══════════════════════════════════════════════════════════════
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from shared_data import DATA_DIR, DB_FILE, STORAGE, import_json_to_sqlite
+
+print("═══════════════════════════════════════════════════")
+print("  MabiliSSS Queue — JSON → SQLite import")
+print("═══════════════════════════════════════════════════")
+print("📂 Source:  ", str(DATA_DIR))
+print("🗄️  Target:  ", str(DB_FILE))
+print()
+
+n = import_json_to_sqlite()
+print(f"  ✅ {n['docs']} settings files (branch / categories / users)")
+print(f"  ✅ {n['days']} queue days, {n['entries']} reservations")
+print()
+if STORAGE != "sqlite":
+    print('Next: set  mode = "sqlite"  under [storage] in config.toml')
+    print("      and restart both portals.")
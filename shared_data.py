@@ -7,7 +7,11 @@
 ═══════════════════════════════════════════════════════════════
 """
 
-import json, os, time, uuid, csv, io
+import json, os, time, uuid, csv, io, threading, sqlite3, select, heapq
+import functools
+import ctypes, ctypes.util
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime, date
 from pathlib import Path
 
@@ -17,6 +21,23 @@ try:
 except ImportError:
     _HAS_FCNTL = False  # Windows
 
+try:
+    import tomllib
+except ImportError:
+    tomllib = None      # Python < 3.11 → built-in defaults
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False # stdlib json
+
+try:
+    import msgpack
+    _HAS_MSGPACK = True
+except ImportError:
+    _HAS_MSGPACK = False
+
 VER = "V1.0.0"
 
 # ── CRITICAL: absolute path anchored to THIS file's location ──
@@ -33,6 +54,97 @@ def _queue_file(d=None):
     d = d or date.today().isoformat()
     return DATA_DIR / f"queue_{d}.json"
 
+def _log_file(d=None):
+    d = d or date.today().isoformat()
+    return DATA_DIR / f"queue_{d}.log"
+
+def _lock_file(d=None):
+    d = d or date.today().isoformat()
+    return DATA_DIR / f"queue_{d}.lock"
+
+def _seq_file(d=None):
+    d = d or date.today().isoformat()
+    return DATA_DIR / f"queue_{d}.seq"
+
+def _ver_file(d=None):
+    d = d or date.today().isoformat()
+    return DATA_DIR / f"queue_{d}.ver"
+
+def _gen_ptr(d=None):
+    d = d or date.today().isoformat()
+    return DATA_DIR / f"queue_{d}.gen"
+
+def _gen_file(d, gen, ext="json"):
+    return DATA_DIR / f"queue_{d or date.today().isoformat()}.{gen}.{ext}"
+
+def _closed_file(d, gen, ext="json"):
+    return DATA_DIR / f"queue_{d or date.today().isoformat()}.{gen}.closed.{ext}"
+
+VER_FILE = DATA_DIR / "data.ver"     # bumped by every save of any kind
+
+DB_FILE = DATA_DIR / "mabilisss.db"
+
+# ── STORAGE SETTINGS (config.toml → [storage]) ──
+#   mode = "json"     → every save publishes a new day file (default)
+#   mode = "journal"  → each mutation appended to queue_YYYY-MM-DD.log,
+#                       folded into a new day file every
+#                       `compact_every` records
+#   keep_generations  → day files (queue_YYYY-MM-DD.<gen>.json, or
+#                       .msgpack) kept after a save, for readers still
+#                       on an older one
+#   mode = "sqlite"   → data/mabilisss.db (WAL), one row per reservation
+#   encoding = "json"    → compact JSON queue files (default)
+#   encoding = "pretty"  → indented JSON, as before
+#   encoding = "msgpack" → binary queue files (needs `msgpack`); readers
+#                          detect the format per file, so modes can mix
+def _load_config():
+    cfg_file = _SCRIPT_DIR / "config.toml"
+    if tomllib is None or not cfg_file.exists():
+        return {}
+    try:
+        with open(cfg_file, "rb") as f:
+            return tomllib.load(f)
+    except Exception:
+        return {}
+
+_CONFIG       = _load_config()
+
+def get_config(section):
+    """One [section] of config.toml as a dict ({} if absent). Shared —
+    don't mutate."""
+    return _CONFIG.get(section, {})
+
+_STORAGE_CFG  = _CONFIG.get("storage", {})
+STORAGE       = _STORAGE_CFG.get("mode", "json")
+COMPACT_EVERY = int(_STORAGE_CFG.get("compact_every", 200))
+LOCK_TIMEOUT  = float(_STORAGE_CFG.get("lock_timeout", 5))
+ENCODING      = _STORAGE_CFG.get("encoding", "json")
+KEEP_GENS     = max(2, int(_STORAGE_CFG.get("keep_generations", 3)))
+if ENCODING == "msgpack" and not _HAS_MSGPACK:
+    ENCODING = "json"
+
+# ── LIVE UPDATES (config.toml → [live]) ──
+#   watch = "auto" → inotify on Linux, polling elsewhere (default)
+#   watch = "poll" → check data.ver every `poll_interval` seconds
+#   watch = "off"  → no watcher; portals keep timed autorefresh
+_LIVE_CFG     = _CONFIG.get("live", {})
+WATCH         = _LIVE_CFG.get("watch", "auto")
+POLL_INTERVAL = float(_LIVE_CFG.get("poll_interval", 1.0))
+DEBOUNCE      = float(_LIVE_CFG.get("debounce", 0.25))
+
+# ── LOAD SHEDDING (config.toml → [load]) ──
+#   Pressure level 0-3 = how many thresholds the slow-render p90
+#   (`slow_ms`) or the active-session count (`sessions`) has crossed
+#   within the last `window` seconds.
+_LOAD_CFG     = _CONFIG.get("load", {})
+LOAD_WINDOW   = float(_LOAD_CFG.get("window", 60))
+SLOW_MS       = list(_LOAD_CFG.get("slow_ms", [400, 1000, 2500]))
+BUSY_SESSIONS = list(_LOAD_CFG.get("sessions", [40, 100, 200]))
+
+# ── STAFF QUEUE (config.toml → [staff]) ──
+#   page_size = cards per page in the Queue tab (0 = show all)
+QUEUE_PAGE_SIZE = int(_CONFIG.get("staff", {}).get("page_size", 25))
+
 # ═══════════════════════════════════════════════════
 #  DEFAULTS
 # ═══════════════════════════════════════════════════
@@ -87,58 +199,1722 @@ OSTATUS_META = {
     "offline":      {"label":"Reservation Closed",            "emoji":"🔴"},
 }
 
+# ═══════════════════════════════════════════════════
+#  READ CACHE  (process-wide, shared by all sessions)
+#  Every Streamlit rerun reads branch/categories/users/queue.
+#  The parsed data is kept per path and validated by (mtime_ns,
+#  size, inode): an unchanged file costs a stat() — no parse, no
+#  copy. Readers share the cached object and must not mutate it;
+#  only the write paths take a private copy (see _clone).
+# ═══════════════════════════════════════════════════
+_CACHE = {}                     # path → (sig, data)
+_CACHE_LOCK = threading.Lock()
+
+def _sig(st):
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _clone(obj):
+    """Private copy of JSON-shaped data, for code about to edit it."""
+    if isinstance(obj, dict):
+        return {k: _clone(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_clone(v) for v in obj]
+    return obj
+
+def _cache_drop(path):
+    with _CACHE_LOCK:
+        _CACHE.pop(path, None)
+
+# ── SINGLE-FLIGHT — when refresh ticks line up, many script threads miss
+#    the cache for the same file version at once; one parses, the rest
+#    wait for it and share the result ──
+_FLIGHTS = {}                   # (cache key, signature) → in-flight load
+_FLIGHT_STATS = {"loads": 0, "coalesced": 0}
+
+def _single_flight(key, load):
+    with _CACHE_LOCK:
+        flight = _FLIGHTS.get(key)
+        leader = flight is None
+        if leader:
+            flight = _FLIGHTS[key] = {"done": threading.Event()}
+            _FLIGHT_STATS["loads"] += 1
+        else:
+            _FLIGHT_STATS["coalesced"] += 1
+    if not leader:
+        flight["done"].wait()
+        return flight["val"] if "val" in flight else load()   # leader failed
+    try:
+        flight["val"] = load()
+        return flight["val"]
+    finally:
+        with _CACHE_LOCK:
+            _FLIGHTS.pop(key, None)
+        flight["done"].set()
+
+def read_stats():
+    """Cache-miss loads this process ran, and how many concurrent
+    identical loads were folded into them instead of running."""
+    with _CACHE_LOCK:
+        return {**_FLIGHT_STATS, "in_flight": len(_FLIGHTS)}
+
+# ═══════════════════════════════════════════════════
+#  ENCODING  (orjson when installed, stdlib json otherwise)
+#  Queue files use ENCODING; branch/categories/users stay
+#  indented JSON so they remain easy to edit by hand.
+# ═══════════════════════════════════════════════════
+def _dumps(obj):
+    """Compact JSON text."""
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=str, ensure_ascii=False)
+
+def _loads(s):
+    return orjson.loads(s) if _HAS_ORJSON else json.loads(s)
+
+def _encode(data, enc):
+    if enc == "msgpack":
+        return msgpack.packb(data, default=str, use_bin_type=True)
+    if enc == "pretty":
+        return json.dumps(data, indent=2, default=str, ensure_ascii=False).encode("utf-8")
+    return _dumps(data).encode("utf-8")
+
+def _decode(raw):
+    """JSON or msgpack, told apart by the first byte."""
+    if raw.lstrip()[:1] in (b"{", b"["):
+        return _loads(raw)
+    if not _HAS_MSGPACK:
+        raise ValueError("msgpack file but msgpack is not installed")
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+def _encoding_for(path):
+    if path in (BRANCH_FILE, CATS_FILE, USERS_FILE):
+        return "pretty"
+    if Path(path).suffix == ".msgpack":
+        return "msgpack"
+    return "json" if ENCODING == "msgpack" else ENCODING
+
+def _queue_ext():
+    """Extension of the queue files written now — it names their encoding."""
+    return "msgpack" if ENCODING == "msgpack" else "json"
+
 # ═══════════════════════════════════════════════════
 #  FILE I/O  (thread-safe with flock on Linux/Mac)
 # ═══════════════════════════════════════════════════
-def _read(path, default):
-    if not path.exists():
+def _load(path, default, immutable=False, prepare=None):
+    """Cached parse of `path`. Shared object — read it, never mutate it.
+    immutable=True: a published generation — read without a lock, and
+    None (not `default`, nothing written) if it is gone. prepare(data)
+    runs once on each fresh parse, before it is cached."""
+    try:
+        sig = _sig(os.stat(path))
+    except OSError:
+        if immutable:
+            return None
         _write(path, default)
         return default
+    with _CACHE_LOCK:
+        hit = _CACHE.get(path)
+    if hit and hit[0] == sig:
+        return hit[1]
+    return _single_flight((path, sig), lambda: _load_file(path, default, immutable, prepare))
+
+def _load_file(path, default, immutable=False, prepare=None):
+    lock = _HAS_FCNTL and not immutable
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_SH)
-            data = json.load(f)
-            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_UN)
-            return data
+        with open(path, "rb") as f:
+            if lock: fcntl.flock(f, fcntl.LOCK_SH)
+            sig = _sig(os.fstat(f.fileno()))
+            data = _decode(f.read())
+            if lock: fcntl.flock(f, fcntl.LOCK_UN)
     except Exception:
-        return default
+        return None if immutable else default
+    if prepare is not None:
+        data = prepare(data)
+    with _CACHE_LOCK:
+        _CACHE[path] = (sig, data)
+    return data
 
 def _write(path, data):
     try:
         tmp = str(path) + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
+        with open(tmp, "wb") as f:
             if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_EX)
-            json.dump(data, f, indent=2, default=str, ensure_ascii=False)
+            f.write(_encode(data, _encoding_for(path)))
             if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_UN)
         os.replace(tmp, str(path))
         return True
     except Exception:
         return False
+    finally:
+        _cache_drop(path)
+
+# ═══════════════════════════════════════════════════
+#  DAY FILE GENERATIONS  (json and journal modes)
+#  A save never rewrites the file readers are on: it writes
+#  queue_YYYY-MM-DD.<gen+1>.json (.msgpack with that encoding), then
+#  atomically replaces the pointer queue_YYYY-MM-DD.gen ("<gen>.<ext>";
+#  a bare number, from before, means .json). Readers follow the pointer and open
+#  that generation without a lock — a consistent snapshot, never a
+#  wait. The newest KEEP_GENS generations stay on disk; older ones
+#  (and a pre-generation queue_YYYY-MM-DD.json) are removed. Writers
+#  are serialized by the queue lock (journal: the log lock). A reader
+#  that keeps losing the race to the collector reads once more under
+#  the queue lock; a pointer to a file that is gone is an error, never
+#  an empty day.
+#  A generation holds the day's active segment (see ACTIVE SEGMENT);
+#  its "closedGen" and "closedExt" name queue_YYYY-MM-DD.<n>.closed.<ext>,
+#  the COMPLETED/NO_SHOW entries as of generation n — rewritten only
+#  when that set changes, and read only when the whole day is wanted.
+# ═══════════════════════════════════════════════════
+_DAY_PATH = {}                      # date → generation file last read
+_CLOSED_PATH = {}                   # date → closed segment last read
+
+def _gen_current(d):
+    """(generation, extension) the pointer names (cached by its
+    signature), or None."""
+    ptr = _gen_ptr(d)
+    try:
+        sig = _sig(os.stat(ptr))
+    except OSError:
+        return None
+    with _CACHE_LOCK:
+        hit = _CACHE.get(ptr)
+    if hit and hit[0] == sig:
+        return hit[1]
+    try:
+        gen, _, ext = ptr.read_text().strip().partition(".")
+        cur = (int(gen), ext or "json")
+    except (OSError, ValueError):
+        return None
+    with _CACHE_LOCK:
+        _CACHE[ptr] = (sig, cur)
+    return cur
+
+def _day_path(d=None):
+    """The day file readers should open now."""
+    cur = _gen_current(d)
+    return _queue_file(d) if cur is None else _gen_file(d, *cur)
+
+def _closed_path(d, hot):
+    """The closed segment generation `hot` names."""
+    return _closed_file(d, hot["closedGen"], hot.get("closedExt", "json"))
+
+def _settled(d, read):
+    """read() until it stops losing races with the collector (None means
+    it lost one). The last try runs under the queue lock, where nothing
+    is collected; if it still finds nothing, the files are gone."""
+    for _ in range(5):
+        val = read()
+        if val is not None:
+            return val
+    if not getattr(_QUEUE_HELD, "on", False):   # a writer's reads: nothing to wait for
+        with _queue_lock(d):
+            val = read()
+        if val is not None:
+            return val
+    raise OSError(f"queue {d}: {_day_path(d).name} is missing or unreadable")
+
+def _keep_latest(cache, d, path):
+    old = cache.get(d)
+    if old != path:
+        cache[d] = path
+        if old is not None:
+            _cache_drop(old)                    # superseded file
+
+def _day_read(d=None):
+    """(path, cached parse) of the day's current generation — shared,
+    never mutate. path is None before the day's first save. Never
+    blocks, never writes."""
+    d = d or date.today().isoformat()
+    def read():
+        path = _day_path(d)
+        data = _load(path, None, immutable=True, prepare=_day_index)
+        if data is None and _gen_current(d) is None and not path.exists():
+            return None, _queue_default(d)      # nothing saved yet today
+        if data is not None:
+            _keep_latest(_DAY_PATH, d, path)
+            return path, data
+        return None     # collected between reading the pointer and opening it
+    return _settled(d, read)
+
+def _day_index(q):
+    """Index a day file as it is read — once per generation. Files keep
+    only the slot counters, which an active segment cannot recount."""
+    cat = q.get("idx", {}).get("cat") if "closedGen" in q else None
+    _reindex(q)
+    if cat is not None:
+        q["idx"]["cat"] = cat
+    return q
+
+def _day_load(d=None):
+    """The current generation as stored: the active segment, or the whole
+    day for a file written before the split."""
+    return _day_read(d)[1]
+
+def _day_hot(d=None):
+    """The day's active segment (cached — shared, never mutate)."""
+    d = d or date.today().isoformat()
+    data = _day_load(d)
+    return data if "closedGen" in data else _active_of(("hot", d), data)
+
+def _day_full(d=None):
+    """The whole day: the current generation merged with its closed
+    segment, cached per generation (shared — never mutate)."""
+    d = d or date.today().isoformat()
+    def read():
+        path, hot = _day_read(d)
+        if "closedGen" not in hot:
+            return hot                          # stored whole
+        key = ("full", d)
+        with _CACHE_LOCK:
+            hit = _CACHE.get(key)
+        if hit and hit[0] == path:
+            return hit[1]
+        # None: closed segment collected under us — follow the pointer again
+        return _single_flight((key, path), lambda: _day_merge(d, path, hot))
+    return _settled(d, read)
+
+def _day_merge(d, path, hot):
+    closed = {"res": []}
+    if hot["closedGen"]:
+        closed = _load(_closed_path(d, hot), None, immutable=True)
+        if closed is None:
+            return None
+        _keep_latest(_CLOSED_PATH, d, _closed_path(d, hot))
+    full = {k: v for k, v in hot.items() if k not in _SEGMENT_KEYS}
+    # both segments keep the day's order; interleave them by issue time
+    full["res"] = list(heapq.merge(hot["res"], closed["res"],
+                                   key=lambda r: r.get("issuedAt") or ""))
+    # the active indexes, "need" and the slot counters are the segment's
+    # (shared, never mutated); only the id map and the views over every
+    # entry take in the closed ones
+    full["idx"] = {**hot["idx"], "order": [], "st": {}, "src": {},
+                   "id": {r.get("id"): i for i, r in enumerate(full["res"])}}
+    for r in _issue_order(full["res"]):
+        for ids in _views(full, r)[:3]:         # order, st, src
+            ids.append(r.get("id"))
+    with _CACHE_LOCK:
+        _CACHE[("full", d)] = (path, full)
+    return full
+
+_SEGMENT_KEYS = ("res", "idx", "closedGen", "closedExt", "activeOnly")
+
+def _day_gens(d, closed=False):
+    """[(generation, path)] of the day's generation files — or, with
+    closed, its closed segments — oldest first, in either encoding."""
+    pre, tag = f"queue_{d}.", ["closed"] if closed else []
+    out = []
+    for f in DATA_DIR.glob(f"queue_{d}.*"):
+        parts = f.name[len(pre):].split(".")
+        if parts[0].isdigit() and parts[1:-1] == tag and parts[-1] in ("json", "msgpack"):
+            out.append((int(parts[0]), f))
+    return sorted(out)
+
+def _publish(d, data):
+    """Write `data` (the whole day, indexed) as the day's next generation
+    and point readers at it. Of the index only the slot counters are
+    saved; readers rebuild the rest (see _day_index). The closed segment
+    is written only if its entries differ from the current one's."""
+    d = d or date.today().isoformat()
+    gens = _day_gens(d)
+    gen = max([(_gen_current(d) or (0,))[0]] + [g for g, _ in gens]) + 1
+    ext = _queue_ext()
+    hot, closed = [], []
+    for r in data.get("res", []):
+        (closed if r.get("status") in _CLOSED else hot).append(r)
+    cur = _day_load(d)
+    seg = {k: v for k, v in data.items() if k not in _SEGMENT_KEYS}
+    if "closedGen" in cur and (_load(_closed_path(d, cur), None, immutable=True)
+                               if cur["closedGen"] else {"res": []}) == {"res": closed}:
+        seg.update(closedGen=cur["closedGen"], closedExt=cur.get("closedExt", "json"))
+    else:
+        seg.update(closedGen=gen if closed else 0, closedExt=ext)
+        if closed and not _write(_closed_file(d, gen, ext), {"res": closed}):
+            return False
+    seg.update(res=hot, idx={"cat": _ensure_idx(data)["cat"]}, activeOnly=True)
+    if not _write(_gen_file(d, gen, ext), seg):
+        return False
+    ptr = _gen_ptr(d)
+    try:
+        tmp = ptr.with_suffix(".gen.tmp")
+        tmp.write_text(f"{gen}.{ext}")
+        os.replace(tmp, ptr)
+    except OSError:
+        return False
+    for old, f in gens:
+        if old <= gen - KEEP_GENS:
+            _gc(f)
+    # each kept generation's segment is among the newest KEEP_GENS
+    for _, f in _day_gens(d, closed=True)[:-KEEP_GENS]:
+        _gc(f)
+    _gc(_queue_file(d))                         # pre-generation file
+    return True
+
+def _gc(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+    _cache_drop(path)
+
+# ═══════════════════════════════════════════════════
+#  ENTRY INDEX  (q["idx"] — built when a day file is read, then kept
+#  up to date by every mutation; day files store only "cat")
+#  id   → position in q["res"], so a staff action finds its entry
+#         without scanning the day's list
+#  res  → resNum → id           ┐ active entries only
+#  mob  → mobile → [ids]        │ (not NO_SHOW / COMPLETED) — what
+#  name → "LAST|FIRST" → [ids]  ┘ tracking and duplicate checks need
+#  cat  → categoryId → {"used": n, <status>: n}  — slot counters over
+#         all entries; "used" leaves out NO_SHOW
+#  order → [ids] by issuedAt     ┐ all entries, each list kept in
+#  st    → status → [ids]        │ issuedAt order, so a staff Queue
+#  src   → source → [ids]        │ filter is a lookup, never a sort
+#  need  → [ids] active, no BQMS# ┘ (see queue_view)
+# ═══════════════════════════════════════════════════
+_CLOSED = ("NO_SHOW", "COMPLETED")
+ACTIVE_STATUSES = ("RESERVED", "ARRIVED", "SERVING")
+
+def _cat_count(q, r, step):
+    c = q["idx"]["cat"].setdefault(r.get("categoryId") or "", {"used": 0})
+    st = r.get("status") or ""
+    c[st] = c.get(st, 0) + step
+    if not c[st]:
+        del c[st]
+    if st != "NO_SHOW":
+        c["used"] += step
+
+def _name_key(last, first):
+    return f"{(last or '').strip().upper()}|{(first or '').strip().upper()}"
+
+def _ordered_add(q, ids, r):
+    """Insert r's id into `ids`, keeping (issuedAt, position in res) order."""
+    res, pos = q["res"], q["idx"]["id"]
+    def _key(eid):
+        return (res[pos[eid]].get("issuedAt") or "", pos[eid])
+    # binary search by hand: bisect's key= needs Python 3.10
+    lo, hi, k = 0, len(ids), _key(r.get("id"))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _key(ids[mid]) < k:
+            lo = mid + 1
+        else:
+            hi = mid
+    ids.insert(lo, r.get("id"))
+
+def _views(q, r):
+    """The ordered lists entry `r` belongs in."""
+    idx = q["idx"]
+    lists = [idx["order"], idx["st"].setdefault(r.get("status") or "", []),
+             idx["src"].setdefault(r.get("source") or "", [])]
+    if not r.get("bqmsNumber") and r.get("status") not in _CLOSED:
+        lists.append(idx["need"])
+    return lists
+
+def _idx_add(q, r, ordered=True):
+    """Count entry `r` and list it in the active indexes.
+    ordered=False appends instead (entries arriving in issue order)."""
+    _cat_count(q, r, 1)
+    for ids in _views(q, r):
+        if ordered:
+            _ordered_add(q, ids, r)
+        else:
+            ids.append(r.get("id"))
+    if r.get("status") in _CLOSED:
+        return
+    idx, rid = q["idx"], r.get("id")
+    if r.get("resNum"):
+        idx["res"][r["resNum"]] = rid
+    if r.get("mobile"):
+        idx["mob"].setdefault(r["mobile"], []).append(rid)
+    idx["name"].setdefault(_name_key(r.get("lastName"), r.get("firstName")), []).append(rid)
+
+def _idx_drop(q, r):
+    """Uncount entry `r` and remove it from the active indexes."""
+    _cat_count(q, r, -1)
+    idx, rid = q["idx"], r.get("id")
+    for ids in _views(q, r):
+        if rid in ids:
+            ids.remove(rid)
+    for name in ("st", "src"):
+        for key in [k for k, ids in idx[name].items() if not ids]:
+            del idx[name][key]
+    if idx["res"].get(r.get("resNum")) == rid:
+        del idx["res"][r["resNum"]]
+    for name, key in (("mob", r.get("mobile")),
+                      ("name", _name_key(r.get("lastName"), r.get("firstName")))):
+        ids = idx[name].get(key)
+        if ids and rid in ids:
+            ids.remove(rid)
+            if not ids:
+                del idx[name][key]
+
+def _reindex(q):
+    res = q.get("res", [])
+    q["idx"] = {"id": {r.get("id"): i for i, r in enumerate(res)},
+                "res": {}, "mob": {}, "name": {}, "cat": {},
+                "order": [], "st": {}, "src": {}, "need": []}
+    for r in _issue_order(res):                 # one sort for every list
+        _idx_add(q, r, ordered=False)
+    return q
+
+def _issue_order(res):
+    """res's entries in (issuedAt, position) order — the ordered lists' key."""
+    return [res[i] for i in sorted(range(len(res)),
+                                   key=lambda i: (res[i].get("issuedAt") or "", i))]
+
+def _idx_sync(q, base):
+    """Update the index q copied from `base` after an update_queue()
+    callback edited q: appended and changed entries are re-listed; if
+    entries were removed or reordered the index is rebuilt."""
+    res, old = q.get("res", []), base.get("res", [])
+    if (_idx_stale(base) or len(res) < len(old)
+            or any(r.get("id") != o.get("id") for r, o in zip(res, old))):
+        return _reindex(q)
+    changed = [i for i, (r, o) in enumerate(zip(res, old)) if r != o]
+    for i in changed:
+        _idx_drop(q, old[i])
+    pos = q["idx"]["id"]
+    for i in changed + list(range(len(old), len(res))):
+        pos[res[i].get("id")] = i
+        _idx_add(q, res[i])
+    return q
+
+def _idx_stale(q):
+    idx = q.get("idx")
+    return not idx or "need" not in idx or len(idx["id"]) != len(q.get("res", []))
+
+def _ensure_idx(q):
+    """Rebuild the index if it is missing, from an older file, or does
+    not cover every entry (e.g. q was edited without going through it)."""
+    if _idx_stale(q):
+        _reindex(q)
+    return q["idx"]
+
+def _find(q, entry_id):
+    """Entry with `entry_id` via the id index (scan if the index is stale)."""
+    res = q.get("res", [])
+    pos = q.get("idx", {}).get("id", {}).get(entry_id)
+    if pos is not None and pos < len(res) and res[pos].get("id") == entry_id:
+        return res[pos]
+    return next((r for r in res if r.get("id") == entry_id), None)
+
+def find_entry(q, res_num=None, mobile=None):
+    """Tracker lookup by reservation number or mobile: the active entry
+    from the index, else any entry (closed ones) with that value."""
+    field, value = ("resNum", res_num) if res_num else ("mobile", mobile)
+    idx = _ensure_idx(q)
+    ids = [idx["res"].get(value)] if res_num else idx["mob"].get(value, [])
+    for eid in ids:
+        r = _find(q, eid)
+        if r and r.get(field) == value and r.get("status") not in _CLOSED:
+            return r
+    hits = [r for r in q.get("res", []) if r.get(field) == value]
+    return next((r for r in hits if r.get("status") not in _CLOSED),
+                hits[0] if hits else None)
+
+# Filters whose entries are all active — served by get_queue(active_only=True)
+LIVE_VIEWS = ("UNASSIGNED",) + ACTIVE_STATUSES
+
+def queue_view(q, key="all"):
+    """Entries for a staff Queue filter, needing a BQMS# first, then by
+    issuedAt. key: "all", "UNASSIGNED", a status or a source."""
+    idx = _ensure_idx(q)
+    if key == "UNASSIGNED":
+        ids = idx["need"]
+    elif key == "all":
+        ids = idx["order"]
+    else:
+        ids = idx["st"].get(key) or idx["src"].get(key) or []
+    res, pos, need = q["res"], idx["id"], set(idx["need"])
+    return ([res[pos[eid]] for eid in ids if eid in need]
+            + [res[pos[eid]] for eid in ids if eid not in need])
+
+# ═══════════════════════════════════════════════════
+#  ACTIVE SEGMENT  (get_queue(active_only=True))
+#  By afternoon most entries are COMPLETED / NO_SHOW. Trackers, slot
+#  counts and the live staff views read only the active entries; the
+#  "cat" counters still cover the whole day, so slot caps and
+#  queue_summary() stay exact. Marked "activeOnly" — save_queue
+#  refuses it. json mode stores the day in this shape (see DAY FILE
+#  GENERATIONS), sqlite selects only active rows; the journal and
+#  older day files derive it in memory, once per version.
+# ═══════════════════════════════════════════════════
+def _hot(q):
+    """q's meta and active entries, indexed, with q's slot counters."""
+    hot = {k: v for k, v in q.items() if k not in ("res", "idx", "closedGen")}
+    hot["res"] = [r for r in q.get("res", []) if r.get("status") not in _CLOSED]
+    cat = (_reindex(dict(q)) if _idx_stale(q) else q)["idx"]["cat"]
+    _reindex(hot)["idx"]["cat"] = cat
+    hot["activeOnly"] = True
+    return hot
+
+def _active_of(key, q):
+    """_hot(q) for a cached whole-day document, kept until q is replaced."""
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+    if hit and hit[0] is q:
+        return hit[1]
+    hot = _hot(q)
+    with _CACHE_LOCK:
+        _CACHE[key] = (q, hot)
+    return hot
+
+# ═══════════════════════════════════════════════════
+#  SEARCH INDEX  (in memory, per process — never saved)
+#  Every 1- to 3-character substring of an entry's lowercased search
+#  fields → set of ids. A query of ≤ 3 characters is one lookup;
+#  longer ones intersect their 3-grams, then confirm the substring.
+#  Kept per (day, fields) for the queue object it was built from — the
+#  shared cached doc, so a repeat search is a lookup. Another doc
+#  (a new version, or a legacy file rewritten without one) is caught
+#  up entry by entry: an entry that is the same object as last time is
+#  skipped, and only ones whose fields changed are re-grammed.
+# ═══════════════════════════════════════════════════
+SEARCH_FIELDS = ("lastName", "firstName", "bqmsNumber", "resNum")
+_GRAM = 3
+_SEARCH_LOCK = threading.Lock()
+_SEARCH = {}                        # (date, fields, active only) → {"doc", "ent", "text", "grams"}
+
+def _grams(text):
+    return {text[i:i + n] for n in range(1, _GRAM + 1)
+            for i in range(len(text) - n + 1)}
+
+def _search_index(q, fields):
+    key = (q.get("date"), fields, bool(q.get("activeOnly")))
+    res = q.get("res", [])
+    ix = _SEARCH.get(key)
+    if ix and ix["doc"] is q:
+        return ix
+    if ix is None:
+        if len(_SEARCH) >= 16:                      # oldest day/fields first
+            del _SEARCH[next(iter(_SEARCH))]
+        ix = _SEARCH[key] = {"doc": None, "ent": {}, "text": {}, "grams": {}}
+    ent, text, grams = ix["ent"], ix["text"], ix["grams"]
+
+    def _drop(eid):
+        ent.pop(eid, None)
+        for g in _grams(text.pop(eid)):
+            bucket = grams[g]
+            bucket.discard(eid)
+            if not bucket:
+                del grams[g]
+
+    seen = set()
+    for r in res:
+        eid = r.get("id")
+        seen.add(eid)
+        if ent.get(eid) is r:
+            continue                                # same entry object
+        # \0 keeps a match from spanning two fields
+        t = "\0".join((r.get(f) or "").lower() for f in fields)
+        if text.get(eid) != t:
+            if eid in text:
+                _drop(eid)
+            text[eid] = t
+            for g in _grams(t):
+                grams.setdefault(g, set()).add(eid)
+        ent[eid] = r
+    for eid in [e for e in text if e not in seen]:
+        _drop(eid)
+    ix["doc"] = q
+    return ix
+
+def search_queue(q, query, fields=SEARCH_FIELDS):
+    """Ids of q's entries with `query` in any of `fields` (case-insensitive).
+    Pass fields=SEARCH_FIELDS + ("mobile",) to also match phone numbers;
+    for several days, search each get_queue(d)."""
+    query = query.strip().lower()
+    with _SEARCH_LOCK:
+        ix = _search_index(q, tuple(fields))
+        if not query:
+            return set(ix["text"])
+        if len(query) <= _GRAM:
+            return set(ix["grams"].get(query, ()))
+        hits = None
+        for i in range(len(query) - _GRAM + 1):
+            bucket = ix["grams"].get(query[i:i + _GRAM])
+            if not bucket:
+                return set()
+            hits = set(bucket) if hits is None else hits & bucket
+        return {eid for eid in hits if query in ix["text"][eid]}
+
+# ═══════════════════════════════════════════════════
+#  MUTATION JOURNAL  (STORAGE = "journal")
+#  queue_YYYY-MM-DD.json = last snapshot (with "logSeq")
+#  queue_YYYY-MM-DD.log  = one JSONL record per mutation since then
+#  Readers replay records with seq > logSeq on top of the snapshot.
+# ═══════════════════════════════════════════════════
+_JOURNAL_LOCK = threading.Lock()    # same-process writers (Windows too)
+
+def _op_name(prev, changed):
+    st = changed.get("status")
+    if st == "NO_SHOW":    return "no_show"
+    if st == "COMPLETED":  return "complete"
+    if st == "SERVING":    return "serve"
+    if "bqmsNumber" in changed: return "assign"
+    return "update"
+
+def _diff_ops(old, new, touched=None):
+    """Records that turn queue `old` into queue `new`.
+    `touched` (entry ids) limits the entry comparison to those ids."""
+    ops = []
+    if touched is not None:
+        for rid in touched:
+            prev, r = _find(old, rid), _find(new, rid)
+            if prev is not None and r is not None and prev != r:
+                changed = {k: v for k, v in r.items() if prev.get(k) != v}
+                ops.append({"op":_op_name(prev, changed), "id":rid, "set":changed})
+        for key in ("oStat", "bqmsState"):
+            if key in new and new[key] != old.get(key):
+                ops.append({"op":key, "value":new[key]})
+        return ops
+    old_by_id = {r.get("id"): r for r in old.get("res", [])}
+    seen = set()
+    for r in new.get("res", []):
+        rid = r.get("id")
+        seen.add(rid)
+        prev = old_by_id.get(rid)
+        if prev is None:
+            ops.append({"op":"reserve", "id":rid, "entry":r})
+        elif prev != r:
+            changed = {k: v for k, v in r.items() if prev.get(k) != v}
+            ops.append({"op":_op_name(prev, changed), "id":rid, "set":changed})
+    for rid in old_by_id:
+        if rid not in seen:
+            ops.append({"op":"remove", "id":rid})
+    for key in ("oStat", "bqmsState"):
+        if key in new and new[key] != old.get(key):
+            ops.append({"op":key, "value":new[key]})
+    return ops
+
+def _replay(q, records):
+    """Apply journal records (in order) on top of snapshot `q`,
+    keeping the snapshot's index up to date as entries change."""
+    pos = _ensure_idx(q)["id"]
+    base = q.get("logSeq", 0)
+    for rec in records:
+        if rec.get("seq", 0) <= base:
+            continue                    # already folded into the snapshot
+        op = rec.get("op")
+        if op == "reserve":
+            pos[rec["id"]] = len(q["res"])
+            q["res"].append(rec["entry"])
+            _idx_add(q, rec["entry"])
+        elif op == "remove":
+            q["res"] = [r for r in q["res"] if r.get("id") != rec["id"]]
+            pos = _reindex(q)["idx"]["id"]
+        elif op in ("oStat", "bqmsState"):
+            q[op] = rec["value"]
+        elif rec.get("id") in pos:
+            r = q["res"][pos[rec["id"]]]
+            _idx_drop(q, r)
+            r.update(rec.get("set", {}))
+            _idx_add(q, r)
+        if "v" in rec:
+            q["version"] = rec["v"]
+        q["logSeq"] = rec["seq"]
+    return q
+
+def _load_log(path):
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(_loads(line))
+                except ValueError:
+                    pass                # torn tail line — picked up next read
+    except OSError:
+        pass
+    return records
+
+def _stat_sig(path):
+    try:
+        return _sig(os.stat(path))
+    except OSError:
+        return None
+
+def _journal_state(d=None):
+    """(state, pending) — snapshot + replayed journal and the number of
+    records not yet folded in. Cached by both files' signatures."""
+    lf = _log_file(d)
+    key = (_stat_sig(_day_path(d)), _stat_sig(lf))
+    with _CACHE_LOCK:
+        hit = _CACHE.get(lf)
+    if hit and hit[0] == key:
+        return hit[1]
+    return _single_flight((lf, key), lambda: _journal_build(d))
+
+def _journal_build(d=None):
+    lf = _log_file(d)
+    for _ in range(3):
+        qf = _day_path(d)
+        key = (_stat_sig(qf), _stat_sig(lf))
+        with _CACHE_LOCK:
+            hit = _CACHE.get(lf)
+        if hit and hit[0] == key:
+            return hit[1]
+        q = _clone(_day_full(d))
+        base = q.get("logSeq", 0)
+        q = _replay(q, _load_log(lf))
+        # A compaction between the two reads would drop records — retry
+        if key[0] is None or _day_path(d) == qf:
+            break
+    val = (q, q.get("logSeq", 0) - base)
+    with _CACHE_LOCK:
+        _CACHE[lf] = (key, val)
+    return val
+
+def _journal_save(data, d=None, touched=None):
+    lf = _log_file(d)
+    try:
+        with _JOURNAL_LOCK, open(lf, "a", encoding="utf-8") as f:
+            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_EX)
+            cur, pending = _journal_state(d)
+            seq = cur.get("logSeq", 0)
+            lines = []
+            # "touch" keeps the version bump of a save that changed nothing
+            for rec in _diff_ops(cur, data, touched) or [{"op":"touch"}]:
+                seq += 1
+                lines.append(_dumps({"seq": seq, "v": data.get("version", 0), **rec}))
+            if lines:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+            if pending + len(lines) >= COMPACT_EVERY:
+                _compact_locked(d, f)
+            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+    except Exception:
+        return False
+    finally:
+        _cache_drop(lf)
+
+def _compact_locked(d, f):
+    """Fold the journal into a new day file. Caller holds the log lock."""
+    _cache_drop(_log_file(d))
+    state = _journal_state(d)[0]
+    if _publish(d, state):
+        f.truncate(0)
+    _cache_drop(_log_file(d))
+
+def compact_queue(d=None):
+    """Fold queue_YYYY-MM-DD.log into the day file (journal mode)."""
+    lf = _log_file(d)
+    if not lf.exists():
+        return True
+    try:
+        with _JOURNAL_LOCK, open(lf, "a", encoding="utf-8") as f:
+            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_EX)
+            _compact_locked(d, f)
+            if _HAS_FCNTL: fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+    except Exception:
+        return False
+
+# ═══════════════════════════════════════════════════
+#  SQLITE BACKEND  (STORAGE = "sqlite")
+#  One row per reservation, WAL mode so member trackers keep
+#  reading while staff write. branch/categories/users live in
+#  `docs`; a day's oStat/bqmsState live in `days`. Every write
+#  bumps the row's `rev`, which validates the read cache.
+# ═══════════════════════════════════════════════════
+_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    name TEXT PRIMARY KEY, rev INTEGER NOT NULL, body TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY, rev INTEGER NOT NULL, body TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS res (
+    date TEXT NOT NULL, id TEXT NOT NULL, seq INTEGER NOT NULL,
+    resNum TEXT, mobile TEXT, categoryId TEXT, status TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (date, id));
+CREATE INDEX IF NOT EXISTS res_id         ON res(id);
+CREATE INDEX IF NOT EXISTS res_date       ON res(date, seq);
+CREATE INDEX IF NOT EXISTS res_resnum     ON res(resNum);
+CREATE INDEX IF NOT EXISTS res_mobile     ON res(mobile);
+CREATE INDEX IF NOT EXISTS res_cat_status ON res(categoryId, status);
+CREATE INDEX IF NOT EXISTS res_day_status ON res(date, status);
+CREATE TABLE IF NOT EXISTS seq (
+    date TEXT PRIMARY KEY, last INTEGER NOT NULL);
+"""
+_DB_LOCAL = threading.local()       # sqlite3 connections are per-thread
+_DB_INIT  = {"done": False}         # WAL + schema: once per process
+_DB_INIT_LOCK = threading.Lock()
+
+def _db():
+    con = getattr(_DB_LOCAL, "con", None)
+    if con is None:
+        con = sqlite3.connect(str(DB_FILE), timeout=10, isolation_level=None)
+        if not _DB_INIT["done"]:
+            with _DB_INIT_LOCK:
+                if not _DB_INIT["done"]:
+                    con.execute("PRAGMA journal_mode=WAL")  # persists in the file
+                    con.executescript(_DB_SCHEMA)
+                    _DB_INIT["done"] = True
+        con.execute("PRAGMA synchronous=NORMAL")            # per connection
+        _DB_LOCAL.con = con
+    return con
+
+def _db_get_doc(name, default):
+    con = _db()
+    row = con.execute("SELECT rev FROM docs WHERE name=?", (name,)).fetchone()
+    if row is None:
+        _db_save_doc(name, default)
+        return default
+    key = ("db", name)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+    if hit and hit[0] == row[0]:
+        return hit[1]
+    def _fetch():
+        try:
+            rev, body = _db().execute("SELECT rev, body FROM docs WHERE name=?",
+                                      (name,)).fetchone()
+            data = _loads(body)
+        except Exception:
+            return default
+        with _CACHE_LOCK:
+            _CACHE[key] = (rev, data)
+        return data
+    return _single_flight((key, row[0]), _fetch)
+
+def _db_save_doc(name, data):
+    try:
+        _db().execute(
+            "INSERT INTO docs (name, rev, body) VALUES (?, 1, ?) "
+            "ON CONFLICT(name) DO UPDATE SET rev = rev + 1, body = excluded.body",
+            (name, _dumps(data)))
+        return True
+    except Exception:
+        return False
+    finally:
+        _cache_drop(("db", name))
+
+def _db_queue(d=None):
+    """Cached day document — shared object, never mutate (see _load)."""
+    d = d or date.today().isoformat()
+    con = _db()
+    row = con.execute("SELECT rev FROM days WHERE date=?", (d,)).fetchone()
+    if row is None:
+        _db_save_queue(_queue_default(d), d)
+        return _queue_default(d)
+    key = ("db", "queue", d)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+    if hit and hit[0] == row[0]:
+        return hit[1]
+    return _single_flight((key, row[0]), lambda: _db_fetch_queue(d))
+
+def _db_fetch_queue(d):
+    con = _db()
+    try:
+        con.execute("BEGIN")        # one consistent WAL snapshot
+        rev, body = con.execute("SELECT rev, body FROM days WHERE date=?",
+                                (d,)).fetchone()
+        q = _loads(body)
+        q["res"] = [_loads(b) for (b,) in con.execute(
+            "SELECT body FROM res WHERE date=? ORDER BY seq", (d,))]
+        con.execute("COMMIT")
+    except Exception:
+        if con.in_transaction: con.execute("ROLLBACK")
+        return _queue_default(d)
+    _reindex(q)             # derived — not stored in the database
+    with _CACHE_LOCK:
+        _CACHE[("db", "queue", d)] = (rev, q)
+    return q
+
+def _db_hot(d=None):
+    """Cached active segment (see _db_queue): only active rows are read."""
+    d = d or date.today().isoformat()
+    row = _db().execute("SELECT rev FROM days WHERE date=?", (d,)).fetchone()
+    if row is None:
+        return _hot(_db_queue(d))
+    key = ("db", "hot", d)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+    if hit and hit[0] == row[0]:
+        return hit[1]
+    return _single_flight((key, row[0]), lambda: _db_fetch_hot(d))
+
+def _db_fetch_hot(d):
+    con = _db()
+    try:
+        con.execute("BEGIN")
+        rev, body = con.execute("SELECT rev, body FROM days WHERE date=?",
+                                (d,)).fetchone()
+        q = _loads(body)
+        q["res"] = [_loads(b) for (b,) in con.execute(
+            "SELECT body FROM res WHERE date=? AND (status IS NULL OR status NOT IN (?, ?)) "
+            "ORDER BY seq", (d, *_CLOSED))]
+        counts = con.execute("SELECT categoryId, status, COUNT(*) FROM res "
+                             "WHERE date=? GROUP BY categoryId, status", (d,)).fetchall()
+        con.execute("COMMIT")
+    except Exception:
+        if con.in_transaction: con.execute("ROLLBACK")
+        return _hot(_queue_default(d))
+    _reindex(q)
+    cat = q["idx"]["cat"] = {}          # slot counters over the whole day
+    for cid, status, n in counts:
+        c = cat.setdefault(cid or "", {"used": 0})
+        c[status or ""] = n
+        if status != "NO_SHOW":
+            c["used"] += n
+    q["activeOnly"] = True
+    with _CACHE_LOCK:
+        _CACHE[("db", "hot", d)] = (rev, q)
+    return q
+
+def _db_version(d=None):
+    row = _db().execute("SELECT body FROM days WHERE date=?",
+                        (d or date.today().isoformat(),)).fetchone()
+    return _loads(row[0]).get("version", 0) if row else 0
+
+def _db_allocate(n, d=None):
+    d = d or date.today().isoformat()
+    con = _db()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute("SELECT last FROM seq WHERE date=?", (d,)).fetchone()
+        if row is None:     # first allocation of a day already in progress
+            row = con.execute("SELECT COALESCE(MAX(json_extract(body, '$.slot')), 0)"
+                              " FROM res WHERE date=?", (d,)).fetchone()
+        last = row[0]
+        con.execute("INSERT OR REPLACE INTO seq (date, last) VALUES (?,?)",
+                    (d, last + n))
+        con.execute("COMMIT")
+        return list(range(last + 1, last + n + 1))
+    except Exception:
+        if con.in_transaction: con.execute("ROLLBACK")
+        return []
+
+def _db_save_queue(data, d=None, touched=None):
+    """Row-level save: only new/changed reservations are written.
+    `touched` (entry ids) limits the save to those rows."""
+    d = d or date.today().isoformat()
+    con = _db()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        if touched is not None:
+            for rid in touched:
+                r = _find(data, rid)
+                if r is not None:
+                    con.execute("UPDATE res SET resNum=?, mobile=?, categoryId=?, "
+                                "status=?, body=? WHERE date=? AND id=?",
+                                (r.get("resNum"), r.get("mobile"), r.get("categoryId"),
+                                 r.get("status"), _dumps(r), d, rid))
+            _db_save_meta(con, data, d)
+            con.execute("COMMIT")
+            return True
+        cur = dict(con.execute("SELECT id, body FROM res WHERE date=?", (d,)))
+        nxt = con.execute("SELECT COALESCE(MAX(seq), 0) FROM res WHERE date=?",
+                          (d,)).fetchone()[0]
+        keep = set()
+        for r in data.get("res", []):
+            rid = r.get("id")
+            keep.add(rid)
+            body = _dumps(r)
+            cols = (r.get("resNum"), r.get("mobile"), r.get("categoryId"),
+                    r.get("status"), body)
+            if rid not in cur:
+                nxt += 1
+                con.execute("INSERT INTO res (resNum, mobile, categoryId, status, "
+                            "body, date, id, seq) VALUES (?,?,?,?,?,?,?,?)",
+                            cols + (d, rid, nxt))
+            elif cur[rid] != body:
+                con.execute("UPDATE res SET resNum=?, mobile=?, categoryId=?, "
+                            "status=?, body=? WHERE date=? AND id=?",
+                            cols + (d, rid))
+        for rid in cur.keys() - keep:
+            con.execute("DELETE FROM res WHERE date=? AND id=?", (d, rid))
+        _db_save_meta(con, data, d)
+        con.execute("COMMIT")
+        return True
+    except Exception:
+        if con.in_transaction: con.execute("ROLLBACK")
+        return False
+    finally:
+        _cache_drop(("db", "queue", d))
+        _cache_drop(("db", "hot", d))
+
+def _db_save_meta(con, data, d):
+    meta = {k: v for k, v in data.items() if k not in ("res", "idx")}
+    con.execute(
+        "INSERT INTO days (date, rev, body) VALUES (?, 1, ?) "
+        "ON CONFLICT(date) DO UPDATE SET rev = rev + 1, body = excluded.body",
+        (d, _dumps(meta)))
+
+def import_json_to_sqlite():
+    """One-shot import of data/*.json (and any journal) into mabilisss.db.
+    Returns {"docs": n, "days": n, "entries": n}."""
+    out = {"docs": 0, "days": 0, "entries": 0}
+    for path in (BRANCH_FILE, CATS_FILE, USERS_FILE):
+        if path.exists():
+            with open(path, "rb") as f:
+                _db_save_doc(path.stem, _decode(f.read()))
+            out["docs"] += 1
+    for d in _json_days():
+        q = _replay(_clone(_day_full(d)), _load_log(_log_file(d)))
+        q.pop("logSeq", None)
+        q["date"] = d
+        if _db_save_queue(q, d):
+            out["days"] += 1
+            out["entries"] += len(q.get("res", []))
+    return out
+
+# ═══════════════════════════════════════════════════
+#  QUEUE LOCK  (sidecar queue_YYYY-MM-DD.lock)
+#  Held only around save_queue's version check + write. Readers
+#  take it only for a last try after losing races to the collector; writers that lost the race get VersionConflict
+#  and update_queue re-applies their change to the latest state.
+# ═══════════════════════════════════════════════════
+_QUEUE_TLOCK = threading.Lock()     # same-process writers (Windows too)
+_QUEUE_HELD = threading.local()     # .on while this thread holds it
+
+@contextmanager
+def _queue_lock(d=None):
+    """Exclusive lock on one day's queue. Retries with bounded backoff;
+    raises TimeoutError after LOCK_TIMEOUT seconds."""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    if not _QUEUE_TLOCK.acquire(timeout=LOCK_TIMEOUT):
+        raise TimeoutError("queue lock busy")
+    try:
+        with open(_lock_file(d), "a") as f:
+            delay = 0.005
+            while _HAS_FCNTL:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError("queue lock busy")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.2)
+            _QUEUE_HELD.on = True
+            try:
+                yield           # closing f releases the flock
+            finally:
+                _QUEUE_HELD.on = False
+    finally:
+        _QUEUE_TLOCK.release()
+
+# ═══════════════════════════════════════════════════
+#  CHANGE TOKENS
+#  Each save replaces a tiny .ver file, so "did anything change?"
+#  is one stat() — no read, whatever the storage mode.
+# ═══════════════════════════════════════════════════
+def _bump(path):
+    try:
+        tmp = path.with_suffix(".ver.tmp")
+        tmp.write_text(str(time.time_ns()))
+        os.replace(tmp, path)       # new inode → new signature every time
+    except OSError:
+        pass
+
+def queue_version(d=None):
+    """Token that changes whenever day `d`'s queue is saved."""
+    return _stat_sig(_ver_file(d))
+
+def data_version():
+    """Token that changes whenever the queue, branch, categories or
+    users are saved."""
+    return _stat_sig(VER_FILE)
+
+# ═══════════════════════════════════════════════════
+#  DATA WATCHER  (one thread per process)
+#  Wakes on inotify events in DATA_DIR (or polls data.ver), waits
+#  DEBOUNCE so a burst of saves becomes one notification, then calls
+#  every subscriber. Callbacks returning False are dropped.
+# ═══════════════════════════════════════════════════
+_IN_CLOSE_WRITE, _IN_MOVED_TO = 0x08, 0x80
+_WATCH_LOCK  = threading.Lock()
+_SUBSCRIBERS = {}
+_WATCHER     = None
+
+def _inotify_fd():
+    """Non-blocking inotify descriptor on DATA_DIR, or None."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, str(DATA_DIR).encode(),
+                                  _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError, TypeError):
+        return None                 # not Linux
+
+def _drain(fd):
+    try:
+        while os.read(fd, 65536):
+            pass
+    except BlockingIOError:
+        pass
+
+def _notify():
+    with _WATCH_LOCK:
+        subs = list(_SUBSCRIBERS.items())
+    for key, callback in subs:
+        try:
+            keep = callback()
+        except Exception:
+            keep = False
+        if keep is False:
+            unsubscribe(key)
+
+def _watch_loop():
+    fd = _inotify_fd() if WATCH == "auto" else None
+    last = data_version()
+    while True:
+        if fd is not None:
+            if select.select([fd], [], [], 60)[0]:
+                _drain(fd)
+        else:
+            time.sleep(POLL_INTERVAL)
+        if data_version() == last:
+            continue                # lock/tmp/seq churn, not a save
+        time.sleep(DEBOUNCE)
+        if fd is not None:
+            _drain(fd)
+        last = data_version()
+        _notify()
+
+def subscribe(key, callback):
+    """Call callback() after each burst of saves until it returns False
+    or unsubscribe(key). Re-subscribing a key replaces its callback.
+    Returns False when watching is turned off in config.toml."""
+    global _WATCHER
+    if WATCH == "off":
+        return False
+    with _WATCH_LOCK:
+        _SUBSCRIBERS[key] = callback
+        if _WATCHER is None:
+            _WATCHER = threading.Thread(target=_watch_loop, name="mabilisss-watch",
+                                        daemon=True)
+            _WATCHER.start()
+    return True
+
+def unsubscribe(key):
+    with _WATCH_LOCK:
+        _SUBSCRIBERS.pop(key, None)
+        _FRAGMENTS.pop(key, None)
+
+# watch_session() drives Streamlit internals — the runtime's session
+# manager and an AppSession's run state, client state and fragment
+# storage. They were checked against these releases (major, minor);
+# on any other, watch_session() returns False and pages keep timed
+# refresh.
+_ST_CHECKED = ((1, 37), (1, 50))
+_FRAGMENTS  = {}                    # session id → ids of its live fragments
+
+def _st_checked():
+    import streamlit
+    try:
+        ver = tuple(int(p) for p in streamlit.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    return _ST_CHECKED[0] <= ver <= _ST_CHECKED[1]
+
+def _live_fragment_ran(ctx):
+    """Remember the running live fragment for its session's reruns."""
+    fid = getattr(ctx, "current_fragment_id", None)
+    with _WATCH_LOCK:
+        if fid and ctx.session_id in _SUBSCRIBERS:
+            _FRAGMENTS.setdefault(ctx.session_id, set()).add(fid)
+
+def _kick(session, sid, tries=20):
+    """On the session's event loop: rerun its live fragments, or the whole
+    page when it shows none. A running script is never interrupted — the
+    session is looked at again after DEBOUNCE."""
+    from streamlit.runtime.app_session import AppSessionState
+    from streamlit.proto.ClientState_pb2 import ClientState
+    if session._state == AppSessionState.APP_IS_RUNNING:
+        if tries:
+            session._event_loop.call_later(DEBOUNCE, _kick, session, sid, tries - 1)
+        return
+    if session._state != AppSessionState.APP_NOT_RUNNING:
+        return                      # shutting down
+    with _WATCH_LOCK:
+        frags = {f for f in _FRAGMENTS.get(sid, ()) if session._fragment_storage.contains(f)}
+        _FRAGMENTS[sid] = frags     # drop fragments the page no longer shows
+    if not frags:
+        session.request_rerun(None)
+        return
+    for fid in frags:
+        cs = ClientState()
+        cs.query_string = session._client_state.query_string
+        cs.page_script_hash = session._client_state.page_script_hash
+        cs.fragment_id = fid
+        session.request_rerun(cs)
+
+def watch_session(enabled=True):
+    """Refresh the calling Streamlit session whenever data changes: its
+    live fragments (see live_fragment) rerun on their own; a page without
+    any reruns whole. Returns False if that is unavailable (watching off,
+    no Streamlit server, or a release outside _ST_CHECKED) — keep
+    st_autorefresh then. enabled=False drops the session's subscription
+    (load shedding)."""
+    from streamlit import runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    if ctx is None or not runtime.exists() or not _st_checked():
+        return False
+    mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+    if mgr is None:
+        return False                # not served (e.g. streamlit.testing)
+    sid = ctx.session_id
+    if not enabled:
+        unsubscribe(sid)
+        return False
+
+    def _rerun():
+        info = mgr.get_active_session_info(sid)
+        if info is None:
+            return False            # browser tab closed
+        session = info.session
+        session._event_loop.call_soon_threadsafe(_kick, session, sid)
+    return subscribe(sid, _rerun)
+
+# ═══════════════════════════════════════════════════
+#  LOAD MONITOR  (one signal for every portal process on DATA_DIR)
+#  Portals bracket each run with render_start()/render_end(), and
+#  live_fragment() does the same for every fragment rerun — a session
+#  shed to fragment-only polling still counts. The pressure level
+#  stretches member refresh intervals so staff pages stay responsive
+#  during the morning rush. Each process publishes its own numbers to
+#  data/load.<pid> (at most once a second); load_stats() adds up the
+#  sessions and takes the worst p90 over all fresh files, so the staff
+#  portal sees the member portal's load and vice versa.
+# ═══════════════════════════════════════════════════
+PRESSURE_LABELS = ("normal", "busy", "high", "overloaded")
+_LOAD_LOCK = threading.Lock()
+_RENDERS   = deque(maxlen=500)      # (finished_at, seconds)
+_SEEN      = {}                     # session key → last run started
+_LOAD_PUB  = {"at": 0.0}            # last publish of this process's numbers
+_LOAD_ALL  = {"at": 0.0, "val": (0, 0)}     # last combined reading
+
+def render_start(key):
+    """Note a run of session `key`; returns the start for render_end()."""
+    now = time.monotonic()
+    with _LOAD_LOCK:
+        _SEEN[key] = now
+    return now
+
+def render_end(t0):
+    now = time.monotonic()
+    with _LOAD_LOCK:
+        _RENDERS.append((now, now - t0))
+        due = now - _LOAD_PUB["at"] >= 1
+        if due:
+            _LOAD_PUB["at"] = now
+    if due:
+        _load_publish()
+
+def _local_load():
+    """(sessions, p90 ms) of this process over the last LOAD_WINDOW seconds."""
+    cutoff = time.monotonic() - LOAD_WINDOW
+    with _LOAD_LOCK:
+        for k in [k for k, t in _SEEN.items() if t < cutoff]:
+            del _SEEN[k]
+        sessions = len(_SEEN)
+        lat = sorted(sec for t, sec in _RENDERS if t >= cutoff)
+    p90 = lat[int(len(lat) * 0.9)] * 1000 if lat else 0
+    return sessions, p90
+
+def _load_publish():
+    sessions, p90 = _local_load()
+    path = DATA_DIR / f"load.{os.getpid()}"
+    try:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(f"{time.time():.3f} {sessions} {p90:.0f}")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def load_stats():
+    """(active_sessions, p90_render_ms) over the last LOAD_WINDOW seconds,
+    across every portal process sharing DATA_DIR. Re-read at most once
+    a second."""
+    now = time.monotonic()
+    with _LOAD_LOCK:
+        if now - _LOAD_ALL["at"] < 1:
+            return _LOAD_ALL["val"]
+    sessions, p90 = _local_load()
+    wall = time.time()
+    for f in DATA_DIR.glob("load.*"):
+        pid = f.name[len("load."):]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            at, n, ms = f.read_text().split()
+            at, n, ms = float(at), int(n), float(ms)
+        except (OSError, ValueError):
+            continue
+        if wall - at > LOAD_WINDOW:
+            _gc(f)                      # process gone (or idle for a window)
+            continue
+        sessions += n
+        p90 = max(p90, ms)
+    with _LOAD_LOCK:
+        _LOAD_ALL.update(at=now, val=(sessions, p90))
+    return sessions, p90
+
+def pressure_level():
+    """0 (normal) … 3 (overloaded)."""
+    sessions, p90 = load_stats()
+    return max(sum(p90 >= ms for ms in SLOW_MS),
+               sum(sessions >= n for n in BUSY_SESSIONS))
+
+def pressure_interval(base, level):
+    """Member refresh interval `base` (seconds) stretched by `level`."""
+    return None if base is None else base * (1 + level)
+
+def live_fragment(run_every=None):
+    """Decorator: st.fragment(run_every=...), so a periodic refresh
+    reruns only that part of the page. Each run is counted by the load
+    monitor under the session's "_load_key", and noted so that
+    watch_session() reruns just this fragment when data changes."""
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            t0 = render_start(st.session_state.setdefault("_load_key", gen_id()))
+            ctx = get_script_run_ctx()
+            if ctx is not None:
+                _live_fragment_ran(ctx)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                render_end(t0)
+        return st.fragment(run_every=run_every)(run)
+    return wrap
 
 # ═══════════════════════════════════════════════════
 #  PUBLIC API
 # ═══════════════════════════════════════════════════
-def get_branch():        return _read(BRANCH_FILE, DEF_BRANCH)
-def save_branch(d):      return _write(BRANCH_FILE, d)
-def get_categories():    return _read(CATS_FILE, DEF_CATS)
-def save_categories(d):  return _write(CATS_FILE, d)
-def get_users():         return _read(USERS_FILE, DEF_USERS)
-def save_users(d):       return _write(USERS_FILE, d)
+def _get_doc(path, default, private=False):
+    if STORAGE == "sqlite":
+        data = _db_get_doc(path.stem, default)
+    else:
+        data = _load(path, default)
+    return _clone(data) if private else data
+
+def _save_doc(path, data):
+    if STORAGE == "sqlite":
+        ok = _db_save_doc(path.stem, data)
+    else:
+        ok = _write(path, data)
+    if ok:
+        _bump(VER_FILE)
+    return ok
 
-def get_queue(d=None):
-    default = {"res":[], "bqmsState":{}, "oStat":"online",
-               "date": d or date.today().isoformat()}
-    return _read(_queue_file(d), default)
+# get_*() return the shared cached document — read it, never mutate it.
+# Pass private=True for a copy to edit and hand to save_*().
+def get_branch(private=False):      return _get_doc(BRANCH_FILE, DEF_BRANCH, private)
+def save_branch(d):                 return _save_doc(BRANCH_FILE, d)
+def get_categories(private=False):  return _get_doc(CATS_FILE, DEF_CATS, private)
+def save_categories(d):             return _save_doc(CATS_FILE, d)
+def get_users(private=False):       return _get_doc(USERS_FILE, DEF_USERS, private)
+def save_users(d):                  return _save_doc(USERS_FILE, d)
 
-def save_queue(data, d=None):
+def _queue_default(d=None):
+    return {"res":[], "bqmsState":{}, "oStat":"online",
+            "date": d or date.today().isoformat()}
+
+def get_queue(d=None, active_only=False, private=False):
+    """Day d's queue — the shared cached document, read-only. Use
+    update_queue() or the entry actions to change it, or private=True
+    for a copy to edit and pass to save_queue(). active_only=True leaves
+    out COMPLETED / NO_SHOW entries (slot counters still count them) —
+    for reading only; save_queue refuses it."""
+    q = _queue_doc(d, active_only)
+    return _clone(q) if private else q
+
+# ── NARROW READS — the member portal's screens need a few values or one
+#    entry, not the whole day ──
+def _queue_doc(d=None, active_only=False):
+    """The cached day document (or its active segment) with a current
+    index. Shared — never mutate."""
+    if STORAGE == "sqlite":
+        q = _db_hot(d) if active_only else _db_queue(d)
+    elif STORAGE == "journal":
+        q = _journal_state(d)[0]
+        if active_only:
+            q = _active_of(("hot", "journal", d or date.today().isoformat()), q)
+    else:
+        q = _day_hot(d) if active_only else _day_full(d)
+    if _idx_stale(q):
+        q = _reindex(dict(q))       # older file: index a shallow copy
+    return q
+
+def queue_summary(d=None):
+    """oStat, bqmsState and entry counts for day d (active segment only)."""
+    q = _queue_doc(d, active_only=True)
+    by_st = {}
+    for c in q["idx"]["cat"].values():
+        for k, n in c.items():
+            if k != "used":
+                by_st[k] = by_st.get(k, 0) + n
+    total = sum(by_st.values())
+    done, ns = by_st.get("COMPLETED", 0), by_st.get("NO_SHOW", 0)
+    return {"oStat": q.get("oStat", "online"), "bqmsState": _clone(q.get("bqmsState", {})),
+            "version": q.get("version", 0), "total": total,
+            "active": total - done - ns, "done": done}
+
+def queue_slot_counts(cats, d=None):
+    """slot_counts() for day d, read off the active segment's counters."""
+    return slot_counts(cats, _queue_doc(d, active_only=True))
+
+def get_entry(entry_id=None, res_num=None, mobile=None, d=None):
+    """A copy of one entry: by id, or by reservation number / mobile as
+    find_entry() does. None when there is no such entry. Looks in the
+    active segment first; the whole day is read only on a miss."""
+    r = None
+    for active_only in (True, False):
+        q = _queue_doc(d, active_only)
+        r = _find(q, entry_id) if entry_id else find_entry(q, res_num=res_num, mobile=mobile)
+        if r:
+            break
+    return _clone(r) if r else None
+
+def _store_queue(data, d=None, touched=None):
     data["date"] = d or date.today().isoformat()
-    return _write(_queue_file(d), data)
+    if STORAGE == "sqlite":
+        ok = _db_save_queue(data, d, touched)
+    elif STORAGE == "journal":
+        ok = _journal_save(data, d, touched)
+    else:
+        ok = _publish(d, data)
+    if ok:
+        _bump(_ver_file(d))
+        _bump(VER_FILE)
+    return ok
+
+class VersionConflict(Exception):
+    """save_queue(expected_version=...) found a newer save on disk."""
+
+def _current_version(d=None):
+    if STORAGE == "sqlite":
+        return _db_version(d)
+    if STORAGE == "journal":
+        return _journal_state(d)[0].get("version", 0)
+    return _day_load(d).get("version", 0)
+
+def _save(data, d=None, expected_version=None, touched=None):
+    if data.get("activeOnly"):
+        raise ValueError("an active_only queue leaves out closed entries — save get_queue(d)")
+    try:
+        with _queue_lock(d):
+            cur = _current_version(d)
+            if expected_version is not None and cur != expected_version:
+                raise VersionConflict(f"queue is at v{cur}, expected v{expected_version}")
+            data["version"] = cur + 1
+            return _store_queue(data, d, touched)
+    except TimeoutError:
+        return False
+
+def save_queue(data, d=None, expected_version=None):
+    """Write a day's queue and bump its `version` (`data` itself is left
+    as it is). With expected_version, raise VersionConflict instead of
+    overwriting a save made after `data` was read."""
+    return _save(_reindex(dict(data)), d, expected_version)
+
+def _detach(q, touched):
+    """A copy of cached queue `q` on which entries `touched` (ids) and the
+    index can be edited: q's other entries are shared, not copied."""
+    idx = q["idx"]
+    out = {**q, "res": list(q["res"]), "idx": {
+        "id": idx["id"], "res": dict(idx["res"]),
+        "order": list(idx["order"]), "need": list(idx["need"]),
+        "cat": {k: dict(c) for k, c in idx["cat"].items()},
+        **{name: {k: list(ids) for k, ids in idx[name].items()}
+           for name in ("st", "src", "mob", "name")}}}
+    for eid in touched:
+        pos = idx["id"].get(eid)
+        if pos is not None:
+            out["res"][pos] = _clone(out["res"][pos])
+    return out
+
+def _update(fn, d=None, touched=None):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    delay = 0.005
+    while True:
+        cur = get_queue(d)
+        q = _clone(cur) if touched is None else _detach(cur, touched)
+        base = q.get("version", 0)
+        if fn(q) is False:
+            return q
+        if touched is None:
+            _idx_sync(q, cur)
+        try:
+            return q if _save(q, d, base, touched) else None
+        except VersionConflict:
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+def update_queue(fn, d=None):
+    """Optimistic read-modify-write of one day's queue.
+    fn(q) edits q in place; returning False skips the write (e.g. a
+    validation failed). Reads take no lock — if another writer saved
+    first, fn is re-applied to the latest state, so it may run more
+    than once. Returns the resulting queue, or None when the write kept
+    conflicting for LOCK_TIMEOUT seconds or failed."""
+    return _update(fn, d)
+
+# ── ENTRY ACTIONS — locate by id index and copy only the entries they
+#    change. journal / sqlite persist just those entries; json mode
+#    publishes a new active segment (see DAY FILE GENERATIONS) ──
+def _patch_entries(changes, d=None):
+    """changes = {entry_id: {field: value}} applied in one transaction."""
+    def _fn(q):
+        _ensure_idx(q)
+        found = [r for r in (_find(q, eid) for eid in changes) if r is not None]
+        if not found:
+            return False
+        for r in found:
+            _idx_drop(q, r)
+            r.update(changes[r["id"]])
+            _idx_add(q, r)
+    return _update(_fn, d, touched=set(changes))
+
+def assign_bqms(entry_id, number, d=None):
+    """Record the BQMS number issued to an entry and mark it ARRIVED."""
+    return _patch_entries({entry_id: {
+        "bqmsNumber": number.strip().upper(), "status": "ARRIVED",
+        "arrivedAt": datetime.now().isoformat()}}, d)
+
+def _status_fields(status, ts=None):
+    fields = {"status": status}
+    if status == "ARRIVED":
+        fields["arrivedAt"] = ts or datetime.now().isoformat()
+    elif status == "COMPLETED":
+        fields["completedAt"] = ts or datetime.now().isoformat()
+    return fields
+
+def set_status(entry_id, status, ts=None, d=None):
+    """Move an entry to `status`; ARRIVED/COMPLETED also stamp their time."""
+    return _patch_entries({entry_id: _status_fields(status, ts)}, d)
+
+def mark_no_show(ids, d=None):
+    """Mark one or more entries NO_SHOW in a single save."""
+    return _patch_entries({eid: {"status": "NO_SHOW"} for eid in ids}, d)
+
+STATUSES = ("RESERVED", "ARRIVED", "SERVING", "COMPLETED", "NO_SHOW")
+
+def apply_edits(edits, d=None):
+    """Commit a bulk-edit grid in one save.
+    edits = {entry_id: (seen, wanted)} — `seen` holds the row's
+    bqmsNumber/status as the grid showed them, `wanted` the new values.
+    A row someone else changed since (or that no longer exists) is left
+    alone and reported. Returns (queue, {entry_id: reason}); queue is
+    None when the save kept failing, and then nothing was written."""
+    conflicts = {}
+    def _fn(q):
+        conflicts.clear()               # fn re-runs on a version race
+        _ensure_idx(q)
+        now = datetime.now().isoformat()
+        changed = False
+        for eid, (seen, wanted) in edits.items():
+            r = _find(q, eid)
+            if r is None:
+                conflicts[eid] = "entry no longer exists"
+                continue
+            if any((r.get(k) or None) != (v or None) for k, v in seen.items()):
+                conflicts[eid] = (f"changed by someone else — now {r.get('status')}"
+                                  + (f", BQMS {r['bqmsNumber']}" if r.get("bqmsNumber") else ""))
+                continue
+            fields = {}
+            num = (wanted.get("bqmsNumber") or "").strip().upper() or None
+            if num != r.get("bqmsNumber"):
+                fields["bqmsNumber"] = num
+            status = wanted.get("status", r.get("status"))
+            if status not in STATUSES:
+                conflicts[eid] = f"unknown status {status!r}"
+                continue
+            if num and not r.get("bqmsNumber") and status == "RESERVED":
+                status = "ARRIVED"      # same as assign_bqms
+            if status != r.get("status"):
+                fields.update(_status_fields(status, now))
+            if fields:
+                _idx_drop(q, r)
+                r.update(fields)
+                _idx_add(q, r)
+                changed = True
+        return changed or False
+    return _update(_fn, d, touched=set(edits)), conflicts
+
+# ── SLOT SEQUENCE — queue_YYYY-MM-DD.seq (or the `seq` table) ──
+def allocate(n=1, d=None):
+    """Hand out `n` consecutive slot numbers for day `d` as a list.
+    Numbers are never reused, even if the reservation is then rejected.
+    Returns [] when the queue lock could not be taken."""
+    if STORAGE == "sqlite":
+        return _db_allocate(n, d)
+    sf = _seq_file(d)
+    try:
+        with _queue_lock(d):
+            try:
+                last = int(sf.read_text())
+            except (OSError, ValueError):   # first allocation of the day
+                last = max((r.get("slot") or 0 for r in get_queue(d)["res"]), default=0)
+            tmp = sf.with_suffix(".tmp")
+            tmp.write_text(str(last + n))
+            os.replace(tmp, sf)
+            return list(range(last + 1, last + n + 1))
+    except (TimeoutError, OSError):
+        return []
+
+def _json_days():
+    """Dates saved as files — a day file, a generation pointer or a
+    journal. Past days' leftover journals are folded into a day file
+    first, so every listed day reads (and exports) whole."""
+    days = sorted({f.name[len("queue_"):].split(".")[0]
+                   for pat in ("queue_*.json", "queue_*.gen", "queue_*.log")
+                   for f in DATA_DIR.glob(pat)})
+    for d in days:
+        lf = _log_file(d)
+        if d < date.today().isoformat() and lf.exists() and lf.stat().st_size:
+            compact_queue(d)
+    return days
+
+def storage_info(d=None):
+    """What backs day d's queue right now: {"mode", "paths", "label",
+    "bytes"} — the current generation (+ closed segment, + journal), or
+    the SQLite database with its -wal/-shm files. For footers and
+    diagnostics."""
+    d = d or date.today().isoformat()
+    if STORAGE == "sqlite":
+        n = _db().execute("SELECT COUNT(*) FROM res WHERE date=?", (d,)).fetchone()[0]
+        paths, label = [DB_FILE], f"{DB_FILE.name} ({n} rows for {d})"
+        # WAL mode keeps recent commits in -wal (and the index in -shm)
+        # until a checkpoint — part of what the database takes on disk
+        paths += [p for p in (Path(f"{DB_FILE}-wal"), Path(f"{DB_FILE}-shm")) if p.exists()]
+    else:
+        path, data = _day_read(d)
+        paths = [path] if path else []
+        if data.get("closedGen"):
+            paths.append(_closed_path(d, data))
+        if STORAGE == "journal" and _log_file(d).exists():
+            paths.append(_log_file(d))
+        label = " + ".join(p.name for p in paths) or f"nothing saved for {d} yet"
+    size = 0
+    for p in paths:
+        try:
+            size += p.stat().st_size
+        except OSError:
+            pass
+    return {"mode": STORAGE, "paths": paths, "label": label, "bytes": size}
 
 def list_queue_days():
-    days = []
-    for f in DATA_DIR.glob("queue_*.json"):
-        days.append(f.stem.replace("queue_", ""))
-    return sorted(days, reverse=True)
+    if STORAGE == "sqlite":
+        return [d for (d,) in _db().execute(
+            "SELECT date FROM days ORDER BY date DESC")]
+    return sorted(_json_days(), reverse=True)
 
 # ═══════════════════════════════════════════════════
 #  HELPERS
@@ -152,35 +1928,146 @@ def today_iso():
 def today_mmdd():
     return date.today().strftime("%m%d")
 
-def slot_counts(cats, res_list):
-    """Active count + cap for each category. NO_SHOW excluded from 'used'."""
+def reuse_view(store, build, key="_view"):
+    """Return the view kept in `store` (e.g. st.session_state) while
+    data_version() and the date are unchanged; otherwise call build()
+    and keep its result. The view is shared between reruns — treat it
+    as read-only."""
+    tok = (today_iso(), data_version())
+    hit = store.get(key)
+    if hit is not None and hit[0] == tok:
+        return hit[1]
+    view = build()
+    store[key] = (tok, view)
+    return view
+
+def queue_stats(q):
+    """Dashboard counts for queue `q`, mostly read off its index."""
+    idx = _ensure_idx(q)
+    res = q.get("res", [])
+    by_st = {k: len(v) for k, v in idx["st"].items()}
+    return {
+        "total":    len(res),
+        "active":   len(res) - by_st.get("COMPLETED", 0) - by_st.get("NO_SHOW", 0),
+        "done":     by_st.get("COMPLETED", 0),
+        "no_show":  by_st.get("NO_SHOW", 0),
+        "online":   len(idx["src"].get("ONLINE", [])),
+        "kiosk":    len(idx["src"].get("KIOSK", [])),
+        "priority": sum(1 for r in res if r.get("priority") == "priority"),
+        "assigned": sum(1 for r in res if r.get("bqmsNumber")),
+        "by_cat":   {cid: sum(n for k, n in c.items() if k != "used")
+                     for cid, c in idx["cat"].items()},
+    }
+
+# ── RENDER CONTEXT — each document / derived value built once per data version ──
+_CTX_LOADERS = {
+    "branch":     lambda c: get_branch(),
+    "cats":       lambda c: get_categories(),
+    "users":      lambda c: get_users(),
+    "qdata":      lambda c: get_queue(),                  # whole day — dashboard, CSV, Done/No-Show
+    "live":       lambda c: get_queue(active_only=True),  # everything else
+    "summary":    lambda c: queue_summary(),
+    "sc":         lambda c: slot_counts(c["cats"], c["live"]),
+    "unassigned": lambda c: queue_view(c["live"], "UNASSIGNED"),
+    "stats":      lambda c: queue_stats(c["qdata"]),
+    "csv":        lambda c: build_csv(c["qdata"]),
+}
+
+class DataContext(dict):
+    """Today's data for a render: ctx["qdata"], ctx["sc"], … are loaded
+    or computed on first access, then kept (see _CTX_LOADERS)."""
+    def __missing__(self, key):
+        value = self[key] = _CTX_LOADERS[key](self)
+        return value
+
+def data_context(store, key="_ctx"):
+    """The DataContext kept in `store` (st.session_state) — a new, empty
+    one once data_version() or the date changes. Read-only, like
+    reuse_view()."""
+    return reuse_view(store, DataContext, key)
+
+def slot_counts(cats, q):
+    """Active count + cap for each category, read from queue `q`'s
+    counters. NO_SHOW excluded from 'used'."""
+    counts = _ensure_idx(q)["cat"]
     m = {}
     for c in cats:
-        active = [r for r in res_list
-                  if r.get("categoryId") == c["id"]
-                  and r.get("status") != "NO_SHOW"]
-        used = len(active)
+        used = counts.get(c["id"], {}).get("used", 0)
         cap  = c.get("cap", 50)
         m[c["id"]] = {"used":used, "cap":cap, "remaining":max(0, cap - used)}
     return m
 
-def next_slot_num(res_list):
-    """GLOBAL sequential slot# — counts ALL entries (incl NO_SHOW/COMPLETED)
-    to guarantee unique reservation numbers."""
-    return len(res_list) + 1
+def verify_counts(q):
+    """Recount queue `q`'s category/status counters from its entries
+    (a whole day — not an active_only copy). Returns {categoryId:
+    (stored, actual)} for each mismatch — empty when consistent."""
+    def _nz(counts):
+        return {k: {s: n for s, n in c.items() if n} for k, c in counts.items()}
+    stored = _nz(q.get("idx", {}).get("cat", {}))
+    actual = _nz(_reindex({"res": q.get("res", [])})["idx"]["cat"])
+    return {k: (stored.get(k, {}), actual.get(k, {}))
+            for k in set(stored) | set(actual)
+            if stored.get(k, {}) != actual.get(k, {})}
 
-def is_duplicate(res_list, last, first, mob):
-    nk = f"{last.strip().upper()}|{first.strip().upper()}"
-    for r in res_list:
-        if r.get("status") in ("NO_SHOW", "COMPLETED"):
-            continue
-        ek = f"{r.get('lastName','')}|{r.get('firstName','')}"
-        if ek == nk:
-            return True
-        if mob and r.get("mobile") and r["mobile"] == mob.strip():
+def next_slot_num(d=None):
+    """GLOBAL sequential slot# for the day, from the persisted allocator —
+    unique even when two submits race. None if the allocator is busy."""
+    got = allocate(1, d)
+    return got[0] if got else None
+
+def is_duplicate(q, last, first, mob):
+    """True if an active entry in queue `q` has the same name or mobile."""
+    idx = _ensure_idx(q)
+    ids = idx["name"].get(_name_key(last, first), [])
+    if mob and mob.strip():
+        ids = ids + idx["mob"].get(mob.strip(), [])
+    for eid in ids:
+        r = _find(q, eid)
+        if r and r.get("status") not in _CLOSED:
             return True
     return False
 
+def wait_estimate(entry, q, cats):
+    """(now_serving, ahead, est_minutes) for an entry holding a BQMS#,
+    from its category's nowServing and avgTime."""
+    cat = next((c for c in cats if c["id"] == entry.get("categoryId")), None)
+    ns_val = q.get("bqmsState", {}).get(entry.get("categoryId", ""), {}).get("nowServing", "—")
+    avg = cat["avgTime"] if cat else 10
+    ahead = 0
+    try:
+        ns_num = int("".join(filter(str.isdigit, str(ns_val))))
+        my_num = int("".join(filter(str.isdigit, str(entry.get("bqmsNumber")))))
+        ahead  = max(0, my_num - ns_num)
+    except (ValueError, TypeError):
+        pass
+    return ns_val, ahead, ahead * avg
+
+_TRACKER_STEPS = (10, 30, 60, 120)     # seconds
+
+def tracker_refresh(entry, q, cats):
+    """Seconds until a member tracker should look again: the longest of
+    _TRACKER_STEPS within a tenth of the estimated wait (10s when next,
+    2 min when far), 30s while waiting for a BQMS# or being served, None
+    once finished. Fixed steps, so the cadence changes only when the
+    wait crosses one — not on every nowServing move."""
+    status = entry.get("status")
+    if status in ("COMPLETED", "NO_SHOW"):
+        return None
+    if status == "SERVING" or not entry.get("bqmsNumber"):
+        return 30
+    est = wait_estimate(entry, q, cats)[2]
+    return max((s for s in _TRACKER_STEPS if s <= est * 6), default=_TRACKER_STEPS[0])
+
+def page_slice(items, page, size=None):
+    """(items on 0-based `page`, page clamped to range, page count).
+    size defaults to QUEUE_PAGE_SIZE; 0 puts everything on one page."""
+    size = QUEUE_PAGE_SIZE if size is None else size
+    if size <= 0 or len(items) <= size:
+        return items, 0, 1
+    pages = -(-len(items) // size)
+    page = max(0, min(page, pages - 1))
+    return items[page * size:(page + 1) * size], page, pages
+
 def format_time_12h(t24):
     try:
         parts = t24.split(":")
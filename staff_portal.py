@@ -13,9 +13,14 @@ from datetime import datetime
 from shared_data import (
     VER, SSS_CSS, ROLE_META, OSTATUS_META,
     get_branch, save_branch, get_categories, save_categories,
-    get_users, save_users, get_queue, save_queue,
+    get_users, save_users, get_queue, update_queue,
+    assign_bqms, set_status, mark_no_show, apply_edits, STATUSES,
     slot_counts, next_slot_num, is_duplicate, gen_id,
-    today_iso, today_mmdd, build_csv, list_queue_days,
+    today_iso, today_mmdd, build_csv, list_queue_days, data_context, page_slice,
+    search_queue, queue_view, LIVE_VIEWS,
+    watch_session, live_fragment,
+    render_start, render_end, pressure_level, load_stats, PRESSURE_LABELS,
+    read_stats,
 )
 
 # ── PAGE CONFIG ──
@@ -35,19 +40,18 @@ _DEFAULTS = {
 for k, v in _DEFAULTS.items():
     if k not in st.session_state:
         st.session_state[k] = v
+_t0 = render_start(st.session_state.setdefault("_load_key", gen_id()))
 
 now = datetime.now()
 
 # ═══════════════════════════════════════════════════
 #  AUTO-REFRESH — keeps queue current without clicking
 # ═══════════════════════════════════════════════════
-_staff_autorefresh_ok = False
-try:
-    from streamlit_autorefresh import st_autorefresh
-    st_autorefresh(interval=15_000, limit=None, key="staff_autorefresh")
-    _staff_autorefresh_ok = True
-except ImportError:
-    pass  # Refresh button still available
+#  (pushed by the shared_data watcher; timed fallback otherwise)
+#  Without push, the queue alert and cards refresh themselves every
+#  15s as fragments.
+_live = watch_session()
+_tick = None if _live else 15
 
 # ── SESSION TIMEOUT (30 min) ──
 if st.session_state.auth_user and (_time.time() - st.session_state.last_activity > 30 * 60):
@@ -57,6 +61,13 @@ if st.session_state.auth_user and (_time.time() - st.session_state.last_activity
 def touch():
     st.session_state.last_activity = _time.time()
 
+def after_action(result):
+    """Rerun to show a queue action, or report that the queue was busy."""
+    if result is None:
+        st.error("⚠️ Queue is busy — please try again.")
+    else:
+        st.rerun()
+
 
 # ═══════════════════════════════════════════════════
 #  LOGIN
@@ -79,7 +90,7 @@ if not st.session_state.auth_user:
         submitted = st.form_submit_button("Login", type="primary",
                                            use_container_width=True, disabled=locked)
         if submitted and not locked:
-            users = get_users()
+            users = get_users(private=True)
             u = next((x for x in users
                       if x["username"].lower() == username.strip().lower()
                       and x.get("active", True)), None)
@@ -103,6 +114,7 @@ if not st.session_state.auth_user:
 
     st.caption("Default password: **mnd2026** · Contact TH/SH for password reset.")
     st.markdown(f'<div class="sss-footer">{VER}</div>', unsafe_allow_html=True)
+    render_end(_t0)
     st.stop()
 
 
@@ -112,14 +124,18 @@ if not st.session_state.auth_user:
 touch()
 user   = st.session_state.auth_user
 role   = user["role"]
-branch = get_branch()
-cats   = get_categories()
-users  = get_users()
-qdata  = get_queue()
-res    = qdata.get("res", [])
-bqms_st= qdata.get("bqmsState", {})
-o_stat = qdata.get("oStat", "online")
-sc     = slot_counts(cats, res)
+
+# One DataContext per data version: every tab and fragment reads from it,
+# so each document is loaded (and each derived value built) at most once.
+# ctx["live"] holds the active entries; ctx["qdata"] (the whole day, closed
+# entries too) is loaded only by the dashboard, CSV and Done/No-Show views.
+ctx    = data_context(st.session_state)
+branch = ctx["branch"]
+cats   = ctx["cats"]
+live   = ctx["live"]
+bqms_st= live.get("bqmsState", {})
+o_stat = live.get("oStat", "online")
+sc     = ctx["sc"]
 rm     = ROLE_META.get(role, {})
 is_readonly = role in ("bh", "dh")
 
@@ -172,7 +188,7 @@ if tab == "change_pw":
             elif new_pw != new_pw2:
                 st.error("Passwords don't match.")
             else:
-                all_u = get_users()
+                all_u = get_users(private=True)
                 for u in all_u:
                     if u["id"] == user["id"]:
                         u["password"] = new_pw
@@ -188,16 +204,11 @@ if tab == "change_pw":
 # ═══════════════════════════════════════════════════
 elif tab == "queue":
     # ── LIVE DATA INDICATOR ──
-    if _staff_autorefresh_ok:
-        st.caption(f"🔄 Live — auto-refreshes every 15s · Last: {now.strftime('%I:%M:%S %p')}")
-    else:
-        st.warning("⚠️ Auto-refresh not installed. Click Refresh below to see updates.")
-        if st.button("🔄 Refresh NOW", type="primary", use_container_width=True):
-            st.rerun()
-
-    unassigned = [r for r in res
-                  if not r.get("bqmsNumber")
-                  and r.get("status") not in ("NO_SHOW","COMPLETED")]
+    _pressure = pressure_level()
+    _sessions, _p90 = load_stats()
+    st.caption(f"🔄 Live — {'updates as soon as the queue changes' if _live else 'auto-refreshes every 15s'}"
+               f" · Last: {now.strftime('%I:%M:%S %p')}"
+               f" · Load: {PRESSURE_LABELS[_pressure]} ({_sessions} sessions, p90 {_p90:.0f} ms)")
 
     if not is_readonly:
         # ── SYSTEM STATUS TOGGLE ──
@@ -209,9 +220,7 @@ elif tab == "queue":
         new_stat   = st.radio("Reservation status:", _stat_opts, horizontal=True,
                               index=_stat_opts.index(cur_label))
         if _stat_map[new_stat] != o_stat:
-            fresh_q = get_queue()          # FRESH read — preserves all reservations
-            fresh_q["oStat"] = _stat_map[new_stat]
-            save_queue(fresh_q)
+            update_queue(lambda q: q.update(oStat=_stat_map[new_stat]))
             st.rerun()
 
         # ── ANNOUNCEMENT (staff + TH and above, NOT kiosk) ──
@@ -237,23 +246,28 @@ elif tab == "queue":
                         ann_clear = st.form_submit_button("🗑️ Clear")
 
                     if ann_save:
-                        fresh_br = get_branch()
+                        fresh_br = get_branch(private=True)
                         fresh_br["announcement"] = new_ann.strip()
                         save_branch(fresh_br)
                         st.success("✅ Announcement posted! Members see it now.")
                         st.rerun()
                     if ann_clear:
-                        fresh_br = get_branch()
+                        fresh_br = get_branch(private=True)
                         fresh_br["announcement"] = ""
                         save_branch(fresh_br)
                         st.success("✅ Announcement cleared.")
                         st.rerun()
 
-        # ── UNASSIGNED ALERT ──
-        if unassigned:
-            st.markdown(f"""<div class="sss-alert sss-alert-red" style="font-size:16px;">
-                🔴 <strong>{len(unassigned)} NEED BQMS#</strong> — Assign numbers below
-            </div>""", unsafe_allow_html=True)
+        # ── UNASSIGNED ALERT (own fragment — refreshes without the page) ──
+        @live_fragment(run_every=_tick)
+        def _need_bqms_alert():
+            unassigned = data_context(st.session_state)["unassigned"]
+            if unassigned:
+                st.markdown(f"""<div class="sss-alert sss-alert-red" style="font-size:16px;">
+                    🔴 <strong>{len(unassigned)} NEED BQMS#</strong> — Assign numbers below
+                </div>""", unsafe_allow_html=True)
+
+        _need_bqms_alert()
 
         # ── BQMS NOW SERVING ──
         with st.expander("🔄 BQMS — Now Serving (click to update)", expanded=False):
@@ -273,9 +287,7 @@ elif tab == "queue":
                             new_bqms[c["id"]] = {"nowServing": val.strip().upper()}
                 if st.form_submit_button("Update Now Serving", type="primary",
                                           use_container_width=True):
-                    fresh_q = get_queue()  # FRESH read — preserves all reservations
-                    fresh_q["bqmsState"] = new_bqms
-                    save_queue(fresh_q)
+                    update_queue(lambda q: q.update(bqmsState=new_bqms))
                     st.success("✅ Updated!")
                     st.rerun()
 
@@ -338,17 +350,21 @@ elif tab == "queue":
                         for e in errors:
                             st.error(f"❌ {e}")
                     else:
-                        fresh     = get_queue()
-                        fresh_res = fresh.get("res", [])
-                        s = slot_counts(cats, fresh_res).get(w_cat_obj["id"],
-                            {"used":0, "cap": w_cat_obj["cap"]})
-
-                        if is_duplicate(fresh_res, wl, wf, wm):
-                            st.error("Duplicate: active reservation exists.")
-                        elif s["remaining"] <= 0:
-                            st.error("Cap reached for this category.")
-                        else:
-                            slot = next_slot_num(fresh_res)
+                        added = {}
+                        def _register(q):
+                            fresh_res = q.setdefault("res", [])
+                            s = slot_counts(cats, q).get(w_cat_obj["id"],
+                                {"used":0, "cap": w_cat_obj["cap"]})
+                            if is_duplicate(q, wl, wf, wm):
+                                errors.append("Duplicate: active reservation exists.")
+                                return False
+                            if s["remaining"] <= 0:
+                                errors.append("Cap reached for this category.")
+                                return False
+                            slot = added.get("slot") or next_slot_num()
+                            if slot is None:
+                                errors.append("Queue is busy — please try again.")
+                                return False
                             rn   = f"K-{today_mmdd()}-{slot:03d}"
                             svc_label = "Walk-in"
                             svc_id    = "walkin"
@@ -357,7 +373,7 @@ elif tab == "queue":
                                 svc_id    = w_svc_pick["svcId"]
 
                             bqms_val = w_bqms.strip().upper() if w_bqms else ""
-                            entry = {
+                            added.update({
                                 "id": gen_id(), "slot": slot, "resNum": rn,
                                 "lastName": wl, "firstName": wf,
                                 "mi": w_mi.strip().upper(), "mobile": wm,
@@ -372,11 +388,15 @@ elif tab == "queue":
                                 "issuedAt": datetime.now().isoformat(),
                                 "arrivedAt": datetime.now().isoformat() if bqms_val else None,
                                 "completedAt": None,
-                            }
-                            fresh_res.append(entry)
-                            fresh["res"] = fresh_res
-                            save_queue(fresh)
-                            st.success(f"✅ Registered: **{rn}** — Give this number to the member for tracking.")
+                            })
+                            fresh_res.append(added)
+
+                        if update_queue(_register) is None:
+                            st.error("⚠️ Queue is busy — please try again.")
+                        elif errors:
+                            st.error(errors[0])
+                        else:
+                            st.success(f"✅ Registered: **{added['resNum']}** — Give this number to the member for tracking.")
                             st.rerun()
 
     # ── FILTER BAR ──
@@ -395,158 +415,233 @@ elif tab == "queue":
 
     search = st.text_input("🔍 Search by name, BQMS#, or Res#", key="qsearch")
 
-    # Apply filters
-    sorted_res = sorted(res, key=lambda r: (
-        0 if not r.get("bqmsNumber") and r.get("status") not in ("NO_SHOW","COMPLETED") else 1,
-        r.get("issuedAt", ""),
-    ))
-    filtered = sorted_res
-    if qf == "UNASSIGNED":
-        filtered = [r for r in filtered
-                    if not r.get("bqmsNumber")
-                    and r.get("status") not in ("NO_SHOW","COMPLETED")]
-    elif qf == "KIOSK":
-        filtered = [r for r in filtered if r.get("source") == "KIOSK"]
-    elif qf == "ONLINE":
-        filtered = [r for r in filtered if r.get("source") == "ONLINE"]
-    elif qf != "all":
-        filtered = [r for r in filtered if r.get("status") == qf]
-
-    if search:
-        s_lower = search.strip().lower()
-        filtered = [r for r in filtered
-                    if s_lower in r.get("lastName","").lower()
-                    or s_lower in r.get("firstName","").lower()
-                    or s_lower in (r.get("bqmsNumber","") or "").lower()
-                    or s_lower in (r.get("resNum","") or "").lower()]
-
-    st.caption(f"Showing {len(filtered)} entries")
-
-    if not filtered:
-        if qf == "UNASSIGNED":
-            st.success("✅ All entries have BQMS numbers assigned!")
+    # ── FILTER + SEARCH (shared by the cards and the grid) ──
+    def _queue_for(qf):
+        return data_context(st.session_state)["live" if qf in LIVE_VIEWS else "qdata"]
+
+    def _filter_queue(q, qf, search):
+        filtered = queue_view(q, qf)             # pre-ordered lists from the index
+
+        if search.strip():
+            hits = search_queue(q, search)      # n-gram index, see shared_data
+            filtered = [r for r in filtered if r.get("id") in hits]
+        return filtered
+
+    # ── PAGER (config.toml [staff] page_size cards per page) ──
+    def _turn_page(step):
+        st.session_state.qpage = st.session_state.get("qpage", 0) + step
+
+    def _pager(page, pages):
+        p1, p2, p3 = st.columns([1, 2, 1])
+        with p1:
+            st.button("◀ Prev", key="qpage_prev", disabled=page == 0,
+                      on_click=_turn_page, args=(-1,), use_container_width=True)
+        with p2:
+            st.markdown(f"<div style='text-align:center;padding-top:8px;font-size:13px;opacity:0.6;'>"
+                        f"Page {page + 1} of {pages}</div>", unsafe_allow_html=True)
+        with p3:
+            st.button("Next ▶", key="qpage_next", disabled=page >= pages - 1,
+                      on_click=_turn_page, args=(1,), use_container_width=True)
+
+    # ── QUEUE CARDS (one fragment — a refresh tick redraws only the list) ──
+    @live_fragment(run_every=_tick)
+    def _queue_cards(qf, search):
+        filtered = _filter_queue(_queue_for(qf), qf, search)
+
+        # Only one page of cards (and their widgets) is built per run.
+        # Need-BQMS entries sort first, oldest first, so page 1 is
+        # always where the work is.
+        if st.session_state.get("_qpage_for") != (qf, search):
+            st.session_state._qpage_for = (qf, search)
+            st.session_state.qpage = 0
+        shown, page, pages = page_slice(filtered, st.session_state.get("qpage", 0))
+        st.session_state.qpage = page
+
+        if pages > 1:
+            st.caption(f"Showing {len(shown)} of {len(filtered)} entries")
         else:
-            st.info("No entries match this filter.")
-    else:
-        for r in filtered:
-            needs_bqms = (not r.get("bqmsNumber")
-                          and r.get("status") not in ("NO_SHOW","COMPLETED"))
-            bdr = "#ef4444" if needs_bqms else "rgba(128,128,128,0.15)"
-            src_icon = "🏢" if r.get("source") == "KIOSK" else "📱"
-            pri_icon = "⭐" if r.get("priority") == "priority" else ""
-            _slabels = {
-                "RESERVED":"📋 RES", "ARRIVED":"✅ ARR", "SERVING":"🔵 SRV",
-                "COMPLETED":"✅ DONE", "NO_SHOW":"❌ NS",
-            }
-
-            bqms_html = ""
-            if r.get("bqmsNumber"):
-                bqms_html = (f'<div style="font-family:monospace;font-size:20px;'
-                             f'font-weight:900;color:#22B8CF;margin-top:4px;">'
-                             f'BQMS: {r["bqmsNumber"]}</div>')
-
-            st.markdown(f"""<div class="sss-card" style="border-left:4px solid {bdr};">
-                <div style="display:flex;justify-content:space-between;align-items:flex-start;">
-                    <div>
-                        <span style="font-family:monospace;font-size:15px;font-weight:800;color:#3399CC;">
-                            {r.get('resNum','')}</span>
-                        <span style="font-size:11px;opacity:0.5;margin-left:6px;">{src_icon}</span>
-                        {pri_icon}<br/>
-                        <strong>{r.get('catIcon','')} {r['lastName']}, {r['firstName']} {r.get('mi','')}</strong><br/>
-                        <span style="font-size:12px;opacity:0.6;">
-                            {r.get('category','')} → {r.get('service','')}</span>
-                        {f'<br/><span style="font-size:11px;opacity:0.5;">📱 {r["mobile"]}</span>' if r.get('mobile') else ''}
-                    </div>
-                    <div style="text-align:right;">
-                        <span class="sss-badge" style="background:rgba(51,153,204,0.15);color:#3399CC;">
-                            {_slabels.get(r['status'], r['status'])}</span>
-                        {bqms_html}
-                    </div>
-                </div>
-            </div>""", unsafe_allow_html=True)
+            st.caption(f"Showing {len(filtered)} entries")
 
-            # ── ACTION BUTTONS ──
-            if not is_readonly:
-                if needs_bqms:
-                    st.markdown(f"""<div style="
-                        background: rgba(220,53,69,0.08);
-                        border: 1px solid rgba(220,53,69,0.25);
-                        border-radius: 8px; padding: 10px 14px; margin-bottom: 8px;
-                    ">
-                        <span style="font-size:12px;font-weight:700;color:#ef4444;">
-                            🎫 Assign BQMS Number for {r.get('resNum','')}</span><br/>
-                        <span style="font-size:11px;opacity:0.6;">
-                            Type the actual number from the BQMS machine</span>
-                    </div>""", unsafe_allow_html=True)
-                    ac1, ac2 = st.columns([3, 1])
-                    with ac1:
-                        bv = st.text_input(
-                            f"BQMS# for {r.get('resNum','')}",
-                            key=f"assign_{r['id']}",
-                            placeholder="Type BQMS# here (e.g., L-023)",
-                        )
-                    with ac2:
-                        st.markdown("<div style='margin-top:6px;'></div>",
-                                    unsafe_allow_html=True)
-                        if st.button("🎫 Assign", key=f"btn_a_{r['id']}",
+        if not filtered:
+            if qf == "UNASSIGNED":
+                st.success("✅ All entries have BQMS numbers assigned!")
+            else:
+                st.info("No entries match this filter.")
+        else:
+            for r in shown:
+                needs_bqms = (not r.get("bqmsNumber")
+                              and r.get("status") not in ("NO_SHOW","COMPLETED"))
+                bdr = "#ef4444" if needs_bqms else "rgba(128,128,128,0.15)"
+                src_icon = "🏢" if r.get("source") == "KIOSK" else "📱"
+                pri_icon = "⭐" if r.get("priority") == "priority" else ""
+                _slabels = {
+                    "RESERVED":"📋 RES", "ARRIVED":"✅ ARR", "SERVING":"🔵 SRV",
+                    "COMPLETED":"✅ DONE", "NO_SHOW":"❌ NS",
+                }
+
+                bqms_html = ""
+                if r.get("bqmsNumber"):
+                    bqms_html = (f'<div style="font-family:monospace;font-size:20px;'
+                                 f'font-weight:900;color:#22B8CF;margin-top:4px;">'
+                                 f'BQMS: {r["bqmsNumber"]}</div>')
+
+                st.markdown(f"""<div class="sss-card" style="border-left:4px solid {bdr};">
+                    <div style="display:flex;justify-content:space-between;align-items:flex-start;">
+                        <div>
+                            <span style="font-family:monospace;font-size:15px;font-weight:800;color:#3399CC;">
+                                {r.get('resNum','')}</span>
+                            <span style="font-size:11px;opacity:0.5;margin-left:6px;">{src_icon}</span>
+                            {pri_icon}<br/>
+                            <strong>{r.get('catIcon','')} {r['lastName']}, {r['firstName']} {r.get('mi','')}</strong><br/>
+                            <span style="font-size:12px;opacity:0.6;">
+                                {r.get('category','')} → {r.get('service','')}</span>
+                            {f'<br/><span style="font-size:11px;opacity:0.5;">📱 {r["mobile"]}</span>' if r.get('mobile') else ''}
+                        </div>
+                        <div style="text-align:right;">
+                            <span class="sss-badge" style="background:rgba(51,153,204,0.15);color:#3399CC;">
+                                {_slabels.get(r['status'], r['status'])}</span>
+                            {bqms_html}
+                        </div>
+                    </div>
+                </div>""", unsafe_allow_html=True)
+
+                # ── ACTION BUTTONS ──
+                if not is_readonly:
+                    if needs_bqms:
+                        st.markdown(f"""<div style="
+                            background: rgba(220,53,69,0.08);
+                            border: 1px solid rgba(220,53,69,0.25);
+                            border-radius: 8px; padding: 10px 14px; margin-bottom: 8px;
+                        ">
+                            <span style="font-size:12px;font-weight:700;color:#ef4444;">
+                                🎫 Assign BQMS Number for {r.get('resNum','')}</span><br/>
+                            <span style="font-size:11px;opacity:0.6;">
+                                Type the actual number from the BQMS machine</span>
+                        </div>""", unsafe_allow_html=True)
+                        ac1, ac2 = st.columns([3, 1])
+                        with ac1:
+                            bv = st.text_input(
+                                f"BQMS# for {r.get('resNum','')}",
+                                key=f"assign_{r['id']}",
+                                placeholder="Type BQMS# here (e.g., L-023)",
+                            )
+                        with ac2:
+                            st.markdown("<div style='margin-top:6px;'></div>",
+                                        unsafe_allow_html=True)
+                            if st.button("🎫 Assign", key=f"btn_a_{r['id']}",
+                                         type="primary", use_container_width=True):
+                                if bv.strip():
+                                    after_action(assign_bqms(r["id"], bv))
+                                else:
+                                    st.warning("Enter a BQMS number first.")
+                        if st.button("❌ No-Show", key=f"ns_{r['id']}",
+                                     use_container_width=True):
+                            after_action(mark_no_show([r["id"]]))
+
+                    elif r.get("status") == "ARRIVED":
+                        ac1, ac2, ac3 = st.columns(3)
+                        with ac1:
+                            if st.button("🔵 Serving", key=f"srv_{r['id']}",
+                                         use_container_width=True):
+                                after_action(set_status(r["id"], "SERVING"))
+                        with ac2:
+                            if st.button("✅ Complete", key=f"done_{r['id']}",
+                                         use_container_width=True):
+                                after_action(set_status(r["id"], "COMPLETED"))
+                        with ac3:
+                            if st.button("❌ NS", key=f"ns2_{r['id']}",
+                                         use_container_width=True):
+                                after_action(mark_no_show([r["id"]]))
+
+                    elif r.get("status") == "SERVING":
+                        if st.button("✅ Complete", key=f"done2_{r['id']}",
                                      type="primary", use_container_width=True):
-                            if bv.strip():
-                                fresh = get_queue()
-                                for fr in fresh["res"]:
-                                    if fr["id"] == r["id"]:
-                                        fr["bqmsNumber"] = bv.strip().upper()
-                                        fr["status"] = "ARRIVED"
-                                        fr["arrivedAt"] = datetime.now().isoformat()
-                                save_queue(fresh)
-                                st.rerun()
-                            else:
-                                st.warning("Enter a BQMS number first.")
-                    if st.button("❌ No-Show", key=f"ns_{r['id']}",
-                                 use_container_width=True):
-                        fresh = get_queue()
-                        for fr in fresh["res"]:
-                            if fr["id"] == r["id"]:
-                                fr["status"] = "NO_SHOW"
-                        save_queue(fresh)
-                        st.rerun()
+                            after_action(set_status(r["id"], "COMPLETED"))
+
+                st.markdown("")  # spacer between cards
+
+            if pages > 1:
+                _pager(page, pages)
+
+    # ── BULK-EDIT GRID — many BQMS#/status changes, one save ──
+    #  The grid shows a snapshot taken when it was (re)loaded; on commit,
+    #  rows someone else changed since are skipped and listed.
+    def _bulk_grid(qf, search):
+        if st.session_state.get("_grid_for") != (qf, search) or "_grid_rows" not in st.session_state:
+            q = get_queue(active_only=qf in LIVE_VIEWS)
+            st.session_state._grid_for = (qf, search)
+            st.session_state._grid_ver = q.get("version", 0)
+            st.session_state._grid_n = st.session_state.get("_grid_n", 0) + 1   # fresh editor state
+            st.session_state._grid_rows = [{
+                "id": r["id"], "Res#": r.get("resNum", ""),
+                "Name": f"{r['lastName']}, {r['firstName']}",
+                "Service": f"{r.get('category','')} → {r.get('service','')}",
+                "BQMS#": r.get("bqmsNumber") or "", "Status": r.get("status"),
+            } for r in _filter_queue(q, qf, search)]
+        rows = st.session_state._grid_rows
+
+        msg = st.session_state.pop("_grid_msg", None)
+        if msg:
+            saved, conflicts = msg
+            if saved:
+                st.success(f"✅ Saved {saved} row(s).")
+            if conflicts:
+                st.warning("⚠️ Not saved — changed elsewhere since the grid was loaded:\n\n"
+                           + "\n".join(f"- **{rn}** — {why}" for rn, why in conflicts))
+        if data_context(st.session_state)["summary"]["version"] != st.session_state._grid_ver:
+            st.caption("ℹ️ The queue has changed since this grid was loaded — "
+                       "rows changed elsewhere will be reported, not overwritten.")
+        if not rows:
+            st.info("No entries match this filter.")
+            return
+
+        with st.form("bulk_grid"):
+            edited = st.data_editor(
+                rows, key=f"grid_{st.session_state._grid_n}", hide_index=True,
+                num_rows="fixed", use_container_width=True,
+                column_config={
+                    "id": None,
+                    "Res#": st.column_config.TextColumn(disabled=True),
+                    "Name": st.column_config.TextColumn(disabled=True),
+                    "Service": st.column_config.TextColumn(disabled=True),
+                    "BQMS#": st.column_config.TextColumn(max_chars=12),
+                    "Status": st.column_config.SelectboxColumn(options=list(STATUSES), required=True),
+                },
+            )
+            g1, g2 = st.columns(2)
+            with g1:
+                commit = st.form_submit_button("💾 Commit changes", type="primary",
+                                               use_container_width=True)
+            with g2:
+                reload = st.form_submit_button("🔄 Reload grid", use_container_width=True)
+
+        if reload:
+            del st.session_state["_grid_rows"]
+            st.rerun()
+        if commit:
+            edits = {}
+            for old, new in zip(rows, edited):
+                if (new["BQMS#"] or "").strip().upper() != old["BQMS#"] or new["Status"] != old["Status"]:
+                    edits[old["id"]] = ({"bqmsNumber": old["BQMS#"] or None, "status": old["Status"]},
+                                        {"bqmsNumber": new["BQMS#"], "status": new["Status"]})
+            if not edits:
+                st.info("No changes to commit.")
+                return
+            q, conflicts = apply_edits(edits)
+            if q is None:
+                st.error("⚠️ Queue is busy — nothing was saved. Please try again.")
+                return
+            res_num = {r["id"]: r["Res#"] for r in rows}
+            st.session_state._grid_msg = (len(edits) - len(conflicts),
+                                          [(res_num[eid], why) for eid, why in conflicts.items()])
+            del st.session_state["_grid_rows"]
+            st.rerun()
 
-                elif r.get("status") == "ARRIVED":
-                    ac1, ac2, ac3 = st.columns(3)
-                    with ac1:
-                        if st.button("🔵 Serving", key=f"srv_{r['id']}",
-                                     use_container_width=True):
-                            fresh = get_queue()
-                            for fr in fresh["res"]:
-                                if fr["id"] == r["id"]: fr["status"] = "SERVING"
-                            save_queue(fresh); st.rerun()
-                    with ac2:
-                        if st.button("✅ Complete", key=f"done_{r['id']}",
-                                     use_container_width=True):
-                            fresh = get_queue()
-                            for fr in fresh["res"]:
-                                if fr["id"] == r["id"]:
-                                    fr["status"] = "COMPLETED"
-                                    fr["completedAt"] = datetime.now().isoformat()
-                            save_queue(fresh); st.rerun()
-                    with ac3:
-                        if st.button("❌ NS", key=f"ns2_{r['id']}",
-                                     use_container_width=True):
-                            fresh = get_queue()
-                            for fr in fresh["res"]:
-                                if fr["id"] == r["id"]: fr["status"] = "NO_SHOW"
-                            save_queue(fresh); st.rerun()
-
-                elif r.get("status") == "SERVING":
-                    if st.button("✅ Complete", key=f"done2_{r['id']}",
-                                 type="primary", use_container_width=True):
-                        fresh = get_queue()
-                        for fr in fresh["res"]:
-                            if fr["id"] == r["id"]:
-                                fr["status"] = "COMPLETED"
-                                fr["completedAt"] = datetime.now().isoformat()
-                        save_queue(fresh); st.rerun()
-
-            st.markdown("")  # spacer between cards
+    if not is_readonly and st.radio("View:", ["🗂 Cards", "📝 Bulk-edit grid"],
+                                    horizontal=True, key="qview") != "🗂 Cards":
+        _bulk_grid(qf, search)
+    else:
+        _queue_cards(qf, search)
 
     # Refresh
     st.markdown("---")
@@ -605,7 +700,7 @@ elif tab == "admin" and role == "th":
                     )
 
                 if save_btn:
-                    fresh_u = get_users()
+                    fresh_u = get_users(private=True)
                     for x in fresh_u:
                         if x["id"] == u["id"]:
                             x["displayName"] = new_name.strip()
@@ -614,14 +709,14 @@ elif tab == "admin" and role == "th":
                     st.success(f"✅ Updated {new_name}")
                     st.rerun()
                 if reset_btn:
-                    fresh_u = get_users()
+                    fresh_u = get_users(private=True)
                     for x in fresh_u:
                         if x["id"] == u["id"]: x["password"] = "mnd2026"
                     save_users(fresh_u)
                     st.success("✅ Password reset to mnd2026")
                     st.rerun()
                 if toggle_btn:
-                    fresh_u = get_users()
+                    fresh_u = get_users(private=True)
                     for x in fresh_u:
                         if x["id"] == u["id"]:
                             x["active"] = not x.get("active", True)
@@ -643,7 +738,7 @@ elif tab == "admin" and role == "th":
                          for x in all_users):
                     st.error("Username already exists.")
                 else:
-                    fresh_u = get_users()
+                    fresh_u = get_users(private=True)
                     fresh_u.append({
                         "id": gen_id(),
                         "username": nu_user.strip().lower(),
@@ -712,7 +807,7 @@ elif tab == "admin" and role == "th":
                         if not new_svcs:
                             st.error("At least one sub-transaction required.")
                         else:
-                            fresh_cats = get_categories()
+                            fresh_cats = get_categories(private=True)
                             if i < len(fresh_cats):
                                 fresh_cats[i] = {
                                     **cat,
@@ -733,7 +828,7 @@ elif tab == "admin" and role == "th":
                                 f"them first, or wait until tomorrow."
                             )
                         else:
-                            fresh_cats = get_categories()
+                            fresh_cats = get_categories(private=True)
                             if i < len(fresh_cats):
                                 removed = fresh_cats.pop(i)
                                 save_categories(fresh_cats)
@@ -778,7 +873,7 @@ elif tab == "admin" and role == "th":
                     cat_id = (nc_label.strip().lower()
                               .replace(" ", "_").replace("/", "_")[:20])
                     # Check for duplicate ID
-                    fresh_cats = get_categories()
+                    fresh_cats = get_categories(private=True)
                     if any(c["id"] == cat_id for c in fresh_cats):
                         st.error("A category with a similar name already exists.")
                     else:
@@ -817,7 +912,7 @@ elif tab == "admin" and role == "th":
                     f"{cat['icon']} {cat['short']} (used: {s['used']})",
                     value=cat["cap"], min_value=1, key=f"cap_{cat['id']}")
             if st.form_submit_button("Save Caps", type="primary"):
-                fresh_cats = get_categories()
+                fresh_cats = get_categories(private=True)
                 for fc in fresh_cats:
                     if fc["id"] in new_caps:
                         fc["cap"] = new_caps[fc["id"]]
@@ -839,12 +934,11 @@ elif tab == "admin" and role == "th":
             with bc2: b_close= st.text_input("Res. Close", value=branch.get("closeTime","16:00"))
             with bc3: b_bqms = st.text_input("BQMS Start", value=branch.get("bqmsStartTime","08:00"))
             if st.form_submit_button("Save Branch Info", type="primary"):
-                branch.update({
+                save_branch({**branch,
                     "name": b_name, "address": b_addr, "hours": b_hours,
                     "phone": b_phone, "openTime": b_open, "closeTime": b_close,
                     "bqmsStartTime": b_bqms,
                 })
-                save_branch(branch)
                 st.success("✅ Saved!")
                 st.rerun()
 
@@ -857,8 +951,7 @@ elif tab == "admin" and role == "th":
                                value=branch.get("announcement",""),
                                placeholder="e.g., Loan release delayed today.")
             if st.form_submit_button("Save Announcement", type="primary"):
-                branch["announcement"] = ann
-                save_branch(branch)
+                save_branch({**branch, "announcement": ann})
                 st.success("✅ Announcement updated!")
                 st.rerun()
 
@@ -869,13 +962,14 @@ elif tab == "admin" and role == "th":
 elif tab == "dash" and role in ("th", "bh", "dh"):
     st.subheader("📊 Dashboard")
 
-    tot  = len(res)
-    done = len([r for r in res if r.get("status") == "COMPLETED"])
-    ns   = len([r for r in res if r.get("status") == "NO_SHOW"])
-    onl  = len([r for r in res if r.get("source") == "ONLINE"])
-    ksk  = len([r for r in res if r.get("source") == "KIOSK"])
-    pri  = len([r for r in res if r.get("priority") == "priority"])
-    assigned = len([r for r in res if r.get("bqmsNumber")])
+    stats = ctx["stats"]
+    tot  = stats["total"]
+    done = stats["done"]
+    ns   = stats["no_show"]
+    onl  = stats["online"]
+    ksk  = stats["kiosk"]
+    pri  = stats["priority"]
+    assigned = stats["assigned"]
     nsr_val  = (ns / tot * 100) if tot else 0
     da_val   = (onl / tot * 100) if tot else 0
 
@@ -914,7 +1008,7 @@ elif tab == "dash" and role in ("th", "bh", "dh"):
     with dtabs[1]:
         st.markdown("**Volume by Category**")
         for cat in cats:
-            cnt = len([r for r in res if r.get("categoryId") == cat["id"]])
+            cnt = stats["by_cat"].get(cat["id"], 0)
             s   = sc.get(cat["id"], {"used":0, "cap": cat["cap"]})
             pct = int((s["used"] / max(s["cap"], 1)) * 100)
             st.markdown(f"**{cat['icon']} {cat['short']}** — {cnt} entries ({pct}% utilized)")
@@ -950,7 +1044,7 @@ elif tab == "dash" and role in ("th", "bh", "dh"):
 
     with dtabs[3]:
         st.markdown("**📥 Export Data**")
-        csv_data = build_csv(qdata)
+        csv_data = ctx["csv"]
         st.download_button("📥 Download Today's CSV", data=csv_data,
                            file_name=f"MabiliSSS_{today_iso()}.csv",
                            mime="text/csv", use_container_width=True)
@@ -975,13 +1069,16 @@ elif tab == "dash" and role in ("th", "bh", "dh"):
 # ═══════════════════════════════════════════════════
 #  FOOTER + SYNC DIAGNOSTIC
 # ═══════════════════════════════════════════════════
-from shared_data import DATA_DIR, _queue_file
-_qf_staff = _queue_file()
-_live_q = get_queue()
+from shared_data import DATA_DIR, storage_info
+_qs_staff = storage_info()
+_live_q = data_context(st.session_state)["summary"]
+_rs = read_stats()
 st.markdown("---")
 st.markdown(f"""<div style="text-align:center;font-size:10px;opacity:0.4;padding:8px;">
     RPT / SSS Gingoog Branch · MabiliSSS Queue {VER}<br/>
-    🔗 Data: <code>{DATA_DIR}</code> · Q: <code>{_qf_staff.name}</code>
-    ({len(_live_q.get('res',[]))} entries) · oStat: {_live_q.get('oStat','?')}
-    · Auto-refresh: {'✅ 15s' if _staff_autorefresh_ok else '❌ NOT INSTALLED'}
+    🔗 Data: <code>{DATA_DIR}</code> · Q: <code>{_qs_staff['label']}</code> · {_qs_staff['bytes'] // 1024} KB
+    ({_live_q['total']} entries) · oStat: {_live_q['oStat']}
+    · Auto-refresh: {'✅ push' if _live else '✅ 15s'}
+    · Reads: {_rs['loads']} loaded, {_rs['coalesced']} coalesced
 </div>""", unsafe_allow_html=True)
+render_end(_t0)
@@ -0,0 +1,155 @@
+"""
+═══════════════════════════════════════════════════════════════
+ MabiliSSS Queue V1.0.0 — STATUS SERVICE (stdlib http.server)
+ Small JSON API + static tracker page for members' phones, so
+ watching "Now Serving" costs a conditional GET, not a Streamlit
+ session.
+   GET /                  → tracker.html (polls the API)
+   GET /now-serving       → Now Serving per category
+   GET /status/<resNum>   → one reservation's status + wait, and
+                            "refresh": seconds until the next poll
+ Responses carry an ETag; If-None-Match → 304 Not Modified.
+ Run: python3 status_server.py        (port from config.toml [status])
+ © RPT / SSS Gingoog Branch 2026
+═══════════════════════════════════════════════════════════════
+"""
+
+import hashlib, json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from shared_data import (
+    VER, get_config, get_branch, get_categories, get_queue,
+    data_version, find_entry, today_iso, wait_estimate, tracker_refresh,
+)
+
+_STATUS_CFG = get_config("status")
+HOST = _STATUS_CFG.get("host", "0.0.0.0")
+PORT = int(_STATUS_CFG.get("port", 8503))
+PAGE = Path(__file__).resolve().parent / "tracker.html"
+
+# ═══════════════════════════════════════════════════
+#  SNAPSHOT — one read per data change, shared by all requests.
+#  Response bodies are cached per snapshot, keyed by path. Only the
+#  active entries are loaded; the whole day only if a lookup misses.
+#  A data change builds a new snapshot, so a request still working
+#  from the old one can only write into the old one's caches.
+# ═══════════════════════════════════════════════════
+_LOCK = threading.Lock()
+_SNAP = {"tok": None}
+
+def _snapshot():
+    global _SNAP
+    tok = (today_iso(), data_version())
+    with _LOCK:
+        if _SNAP["tok"] != tok:
+            _SNAP = {"tok": tok, "q": get_queue(active_only=True), "day": None,
+                     "cats": get_categories(), "branch": get_branch(), "bodies": {}}
+        return _SNAP
+
+def _lookup(snap, res_num):
+    t = find_entry(snap["q"], res_num=res_num)
+    if t is None:
+        with _LOCK:
+            if snap["day"] is None:         # completed / no-show / unknown
+                snap["day"] = get_queue()
+        t = find_entry(snap["day"], res_num=res_num)
+    return t
+
+def _now_serving(snap):
+    q, bq = snap["q"], snap["q"].get("bqmsState", {})
+    return 200, {
+        "branch": snap["branch"].get("name", ""),
+        "date": q.get("date"),
+        "oStat": q.get("oStat", "online"),
+        "announcement": snap["branch"].get("announcement", ""),
+        "categories": [{"id": c["id"], "label": c["label"], "icon": c.get("icon", ""),
+                        "nowServing": bq.get(c["id"], {}).get("nowServing", "")}
+                       for c in snap["cats"]],
+    }
+
+def _status(snap, res_num):
+    t = _lookup(snap, res_num.strip().upper())
+    if not t:
+        return 404, {"error": "not found", "resNum": res_num}
+    out = {
+        "branch": snap["branch"].get("name", ""),
+        "resNum": t.get("resNum"), "status": t.get("status"),
+        "category": t.get("category"), "service": t.get("service"),
+        "catIcon": t.get("catIcon", ""), "bqmsNumber": t.get("bqmsNumber"),
+        "nowServing": None, "ahead": None, "estWait": None,
+        "refresh": tracker_refresh(t, snap["q"], snap["cats"]),
+    }
+    if t.get("bqmsNumber") and t.get("status") not in ("COMPLETED", "NO_SHOW"):
+        out["nowServing"], out["ahead"], out["estWait"] = wait_estimate(t, snap["q"], snap["cats"])
+    return 200, out
+
+def _page():
+    try:
+        return 200, PAGE.read_bytes()
+    except OSError:
+        return 404, b"tracker.html missing"
+
+# ═══════════════════════════════════════════════════
+#  HTTP
+# ═══════════════════════════════════════════════════
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+
+class StatusHandler(BaseHTTPRequestHandler):
+    server_version = f"MabiliSSS-status/{VER}"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/") or "/"
+        if path in ("/", "/tracker"):
+            code, body = _page()
+            self._send(code, body, ctype="text/html; charset=utf-8")
+            return
+        snap = _snapshot()
+        hit = snap["bodies"].get(path)
+        if hit is None:
+            if path == "/now-serving":
+                code, payload = _now_serving(snap)
+            elif path.startswith("/status/"):
+                code, payload = _status(snap, unquote(path[len("/status/"):]))
+            else:
+                code, payload = 404, {"error": "unknown path"}
+            body = json.dumps(payload, separators=(",", ":"), default=str,
+                              ensure_ascii=False).encode("utf-8")
+            hit = (code, body, _etag(body))
+            if code == 200:             # don't let unknown paths grow the cache
+                snap["bodies"][path] = hit
+        self._send(*hit, ctype="application/json; charset=utf-8")
+
+    def _send(self, code, body, etag=None, ctype="text/plain"):
+        etag = etag or _etag(body)
+        if code == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")   # revalidate every poll
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass                    # one line per phone poll is just noise
+
+def serve(host=HOST, port=PORT):
+    httpd = ThreadingHTTPServer((host, port), StatusHandler)
+    httpd.daemon_threads = True
+    print(f"MabiliSSS status service {VER} on http://{host}:{port}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+if __name__ == "__main__":
+    serve()